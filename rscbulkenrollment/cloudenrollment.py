@@ -1,65 +1,334 @@
 # Copyright 2024 HP Development Company, L.P.
 # SPDX-License-Identifier: MIT
 '''Functions for enrollment rscs to the cloud'''
+import csv
+import heapq
+import html
 import logging
+import functools
+import os
+import sys
 import time
-from typing import List
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 from rscbulkenrollment.rsc import rsc as rscpkg
+from rscbulkenrollment.deadline import run_with_deadline
+from rscbulkenrollment.journal import Journal
+from rscbulkenrollment.metrics import METRICS
 
 VERIFICATION_URI = "https://rsm.hp.com/console/binding/device/activate?user_codes="
 
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH_SIZE = 100
+
+MONITOR_INTERVAL = 5
+MONITOR_MIN_INTERVAL = 1
+MONITOR_MAX_BACKOFF = 60
+
+CANCEL_TIMEOUT = 3
+CANCEL_DEADLINE = 15
+BIND_DRAIN_DEADLINE = 15
+DEFAULT_CANCEL_WORKERS = 32
+
 def bind_rscs_to_cloud(rscs: List[rscpkg.RSC],
                           proxy: str,
-                          ntp: str) -> List[rscpkg.RSC]:
-    '''Initiates the enrollment process for all RSCs passed in.
-    Returns the list of RSCs that have successfully started the process.'''
-    rscs_to_monitor: List[rscpkg.RSC] = []
+                          ntp: str,
+                          workers: int = DEFAULT_WORKERS,
+                          *,
+                          journal: Optional[Journal] = None,
+                          reconcile: bool = False) -> List[rscpkg.RSC]:
+    '''Initiates the enrollment process for all RSCs passed in, using up to
+    'workers' RSCs at a time. Errors are recorded per RSC and don't affect the others.
+    The outcome for each RSC is recorded in the journal, if any. With 'reconcile',
+    only the requests needed to reach the desired state are sent (see reconcile_rsc).
+    Returns the list of RSCs that have successfully started the process,
+    in the same order they were passed in.'''
+    # pylint: disable=too-many-arguments
+    with CloudBinder(proxy, ntp, workers, journal=journal, reconcile=reconcile) as binder:
+        for rsc in rscs:
+            binder.submit(rsc)
+    return binder.started()
+
+class CloudBinder:
+    '''Initiates the enrollment process of RSCs as they are submitted, using up to
+    'workers' RSCs at a time. Leaving the 'with' block waits for all of them, unless
+    it is left with an exception, like a CTRL+C: the RSCs not started yet are then
+    dropped, and the ones being started are waited for up to BIND_DRAIN_DEADLINE
+    seconds. With 'reconcile', RSCs are reconciled with reconcile_rsc instead.
+    RSCs for which 'skip', called by the workers, returns True are left alone.'''
 
-    for rsc in rscs:
+    def __init__(self, proxy: str, ntp: str, workers: int = DEFAULT_WORKERS, *,
+                 journal: Optional[Journal] = None, reconcile: bool = False,
+                 skip: Optional[Callable[[rscpkg.RSC], bool]] = None) -> None:
+        # pylint: disable=too-many-arguments
+        self.proxy = proxy
+        self.ntp = ntp
+        self.journal = journal
+        self.reconcile = reconcile
+        self.skip = skip
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.submitted: List[Tuple[rscpkg.RSC, Future]] = []
+
+    def __enter__(self) -> 'CloudBinder':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.cancel()
+            return
         try:
-            logging.info("Logging in '%s'", rsc.address)
-            rsc.login()
+            self.executor.shutdown(wait=True)
+        except KeyboardInterrupt:
+            self.cancel()
+            raise
 
-            needs_password_change = rsc.check_needs_change_password()
-            if needs_password_change:
-                logging.info("Changing password for '%s'", rsc.address)
-                rsc.change_password()
-                print(f"Changed password for rscpkg.RSC '{rsc.address}'")
-                logging.info("Logging in to '%s' with new password",
-                             rsc.address)
-                rsc.login()
-            if proxy or ntp:
-                logging.info(
-                    "Changing proxy/NTP settings to rscpkg.RSC %s", rsc.address)
-                rsc.set_proxy_ntp_settings(proxy, ntp)
-                time.sleep(2)
+    def cancel(self, deadline: float = BIND_DRAIN_DEADLINE) -> None:
+        '''Drops the RSCs whose enrollment has not started, and waits up to 'deadline'
+        seconds for the ones being started, at most one per worker, so that their
+        password change or enrollment is journaled before the journal is closed.
+        A CTRL+C stops the wait.'''
+        # cancel_futures of shutdown() is not available in Python 3.8
+        for _, future in self.submitted:
+            future.cancel()
+        self.executor.shutdown(wait=False)
+        running = [future for _, future in self.submitted if not future.done()]
+        if running:
+            print(f"Waiting up to {deadline} seconds for the {len(running)} RSC(s)"
+                  " being enrolled...")
+            wait(running, timeout=deadline)
+
+    def submit(self, rsc: rscpkg.RSC) -> None:
+        '''Queues the RSC to start its enrollment as soon as a worker is free'''
+        self.submitted.append((rsc, self.executor.submit(self.bind, rsc)))
+
+    def bind(self, rsc: rscpkg.RSC) -> bool:
+        '''Initiates the enrollment process for the RSC and records its outcome'''
+        if self.skip and self.skip(rsc):
+            return False
+        bind = reconcile_rsc if self.reconcile else bind_rsc_to_cloud
+        started = bind(rsc, self.proxy, self.ntp, journal=self.journal)
+        if self.journal:
+            self.journal.record(rsc, "enroll")
+        return started
 
+    def started(self) -> List[rscpkg.RSC]:
+        '''Waits for the submitted RSCs and returns the ones that have successfully
+        started the process, in the order they were submitted'''
+        return [rsc for rsc, future in self.submitted if future.result()]
+
+def bind_rsc_to_cloud(rsc: rscpkg.RSC, proxy: str, ntp: str,
+                      journal: Optional[Journal] = None) -> bool:
+    '''Initiates the enrollment process for a single RSC. The session and password
+    check of a previous validation are reused if there was one.
+    The time spent in each phase is recorded in the metrics, and a password change
+    in the journal, if any.
+    Returns True if the RSC started the process and has to be monitored.'''
+    try:
+        logging.info("Logging in '%s'", rsc.address)
+        with METRICS.phase(rsc.address, "login"):
+            rsc.login()
+        ensure_password_changed(rsc, journal)
+        if proxy or ntp:
+            logging.info(
+                "Changing proxy/NTP settings to RSC %s", rsc.address)
+            with METRICS.phase(rsc.address, "settings"):
+                if not rsc.set_proxy_ntp_settings(proxy or "", ntp or ""):
+                    logging.info("RSC '%s' already has the proxy/NTP settings", rsc.address)
+
+        with METRICS.phase(rsc.address, "enroll"):
             if rsc.is_enrolled_to_cloud():
                 logging.info("RSC '%s' is already enrolled to cloud",
                              rsc.address)
-                continue
+                return False
             logging.info("Enrolling to cloud '%s'", rsc.address)
-            rsc.enroll_to_cloud()
-            rscs_to_monitor.append(rsc)
+            rsc.enroll_to_cloud(check_enrolled=False)
+        return True
+    except (rscpkg.RSCException, KeyError) as exp:
+        logging.error(exp)
+        rsc.add_error(str(exp))
+        return False
+
+def reconcile_rsc(rsc: rscpkg.RSC, proxy: str, ntp: str,
+                  journal: Optional[Journal] = None) -> bool:
+    '''Brings a single RSC to the desired state, sending only the requests needed to
+    get there. The binding status, and the proxy/NTP settings if any were given, are
+    read first: an RSC that is already enrolled with the right settings only costs a
+    login and one GET, and its password is not checked. An RSC that refuses the reads
+    with a 403, as a fresh RSC does until its password is changed, gets its password
+    changed and is read again.
+    Returns True if the RSC started the enrollment process and has to be monitored.'''
+    try:
+        with METRICS.phase(rsc.address, "login"):
+            rsc.login()
+        settings = rscpkg.get_proxy_ntp_settings(proxy or "", ntp or "")
+        try:
+            enrolled, current = read_rsc_state(rsc, settings)
         except rscpkg.RSCException as exp:
-            logging.error(exp)
-    return rscs_to_monitor
+            if exp.status_code != 403:
+                raise
+            logging.info("RSC '%s' refused to be read, checking its password", rsc.address)
+            ensure_password_changed(rsc, journal)
+            enrolled, current = read_rsc_state(rsc, settings)
+        settings_ok = rscpkg.settings_applied(current, settings)
+        if enrolled and settings_ok:
+            logging.info("RSC '%s' is already in the desired state", rsc.address)
+            return False
+
+        if not enrolled:
+            ensure_password_changed(rsc, journal)
+        if not settings_ok:
+            logging.info("Changing proxy/NTP settings to RSC %s", rsc.address)
+            with METRICS.phase(rsc.address, "settings"):
+                rsc.set_proxy_ntp_settings(proxy or "", ntp or "", current=current)
+        if enrolled:
+            return False
+        logging.info("Enrolling to cloud '%s'", rsc.address)
+        with METRICS.phase(rsc.address, "enroll"):
+            rsc.enroll_to_cloud(check_enrolled=False)
+        return True
+    except (rscpkg.RSCException, KeyError) as exp:
+        logging.error(exp)
+        rsc.add_error(str(exp))
+        return False
+
+def read_rsc_state(rsc: rscpkg.RSC, settings: Dict) -> Tuple[bool, Dict]:
+    '''Reads whether the RSC is enrolled to cloud, and its proxy/NTP settings if
+    'settings' are wanted'''
+    with METRICS.phase(rsc.address, "read state"):
+        enrolled = rsc.is_enrolled_to_cloud()
+        current = rsc.read_proxy_ntp_settings() if settings else {}
+    return enrolled, current
+
+def ensure_password_changed(rsc: rscpkg.RSC, journal: Optional[Journal] = None) -> None:
+    '''Changes the password of a logged in RSC if it requires it, and logs in again.
+    The result of a previous password check is reused if there was one.
+    The change is recorded in the journal, if any, as soon as it is done, so a run
+    resumed after a crash logs in with the new password.'''
+    with METRICS.phase(rsc.address, "password"):
+        needs_password_change = rsc.password_change_required
+        if needs_password_change is None:
+            needs_password_change = rsc.check_needs_change_password()
+        if needs_password_change:
+            if not rsc.new_password:
+                raise rscpkg.RSCException(
+                    f"RSC '{rsc.address}' needs password change,"
+                    " but no new password was specified for it")
+            logging.info("Changing password for '%s'", rsc.address)
+            rsc.change_password()
+            if journal:
+                journal.record(rsc, "password")
+            print(f"Changed password for RSC '{rsc.address}'")
+            logging.info("Logging in to '%s' with new password",
+                         rsc.address)
+            rsc.login()
+
 
+class Batch(NamedTuple):
+    '''RSCs whose user codes are activated together, with one verification URI'''
+    number: int
+    rscs: List[rscpkg.RSC]
 
-def print_verification_uri(rscs_to_monitor: List[rscpkg.RSC]) -> None:
-    '''Prints the verification URI'''
-    user_codes = [rsc.user_code for rsc in rscs_to_monitor if len(rsc.user_code) > 0 ]
-    if len(user_codes) > 0:
+    @property
+    def uri(self) -> str:
+        '''Verification URI of all user codes of the batch'''
+        return VERIFICATION_URI + ",".join(rsc.user_code for rsc in self.rscs)
+
+
+def print_verification_uri(rscs_to_monitor: List[rscpkg.RSC],
+                           batch_size: int = DEFAULT_BATCH_SIZE,
+                           directory: Optional[str] = None) -> List[Batch]:
+    '''Prints the verification URIs, one per batch of up to 'batch_size' user codes,
+    and writes the batches to 'directory', if given. Returns the batches.'''
+    batches = make_batches(rscs_to_monitor, batch_size)
+    if len(batches) == 1:
         print("Verification URI is ready! Paste this link in a web browser:",
-              VERIFICATION_URI + ",".join(user_codes), sep='\n')
+              batches[0].uri, sep='\n')
+    elif len(batches) > 1:
+        print(f"Verification URIs are ready! Paste these {len(batches)} links in a web browser,"
+              " they can be activated at the same time:")
+        for batch in batches:
+            print(f"Batch {batch.number} ({len(batch.rscs)} RSCs):", batch.uri, sep='\n')
     else:
         print("No user codes received!")
         for rsc in rscs_to_monitor:
             if rsc.monitor_state != rscpkg.TaskState.ALREADY_ENROLLED:
                 rsc.monitor_state = rscpkg.TaskState.ERROR
+    if batches and directory:
+        try:
+            write_batches(batches, directory)
+            print(f"Verification URIs written to '{directory}'")
+        except OSError as exp:
+            logging.error("Failed to write the verification URIs: %s", exp)
+    return batches
+
+def make_batches(rscs: List[rscpkg.RSC], batch_size: int) -> List[Batch]:
+    '''Splits the RSCs with a user code in batches of up to 'batch_size' RSCs'''
+    with_codes = [rsc for rsc in rscs if len(rsc.user_code) > 0]
+    return [Batch(number, with_codes[start:start + batch_size])
+            for number, start in enumerate(range(0, len(with_codes), max(1, batch_size)), 1)]
+
+def write_batches(batches: List[Batch], directory: str) -> None:
+    '''Writes a text and an HTML file per batch to 'directory', plus batches.csv with
+    the URI of each batch, ready to turn into QR codes, and devices.csv with the batch
+    of each RSC'''
+    os.makedirs(directory, exist_ok=True)
+    for batch in batches:
+        name = os.path.join(directory, f"batch-{batch.number:03d}")
+        with open(name + ".txt", 'w', encoding='utf-8') as text_file:
+            text_file.write(batch.uri + "\n\n")
+            for rsc in batch.rscs:
+                text_file.write(f"{rsc.address} {rsc.user_code}\n")
+        rows = "".join(f"<tr><td>{html.escape(rsc.address)}</td>"
+                       f"<td>{html.escape(rsc.user_code)}</td></tr>\n" for rsc in batch.rscs)
+        with open(name + ".html", 'w', encoding='utf-8') as html_file:
+            html_file.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+                            f"<title>RSC enrollment batch {batch.number}</title></head><body>\n"
+                            f"<p><a href=\"{html.escape(batch.uri)}\">Activate the"
+                            f" {len(batch.rscs)} RSCs of batch {batch.number}</a></p>\n"
+                            f"<table><tr><th>Address</th><th>User code</th></tr>\n{rows}"
+                            "</table></body></html>\n")
+    with open(os.path.join(directory, "batches.csv"), 'w', encoding='utf-8',
+              newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["batch", "devices", "uri"])
+        for batch in batches:
+            writer.writerow([batch.number, len(batch.rscs), batch.uri])
+    with open(os.path.join(directory, "devices.csv"), 'w', encoding='utf-8',
+              newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["address", "user_code", "batch"])
+        for batch in batches:
+            for rsc in batch.rscs:
+                writer.writerow([rsc.address, rsc.user_code, batch.number])
+
+
+class BatchProgress:
+    '''Prints the progress of a batch each time the enrollment of one of its RSCs
+    completes'''
+    # pylint: disable=too-few-public-methods
 
-def monitor_rscs(rscs_to_monitor: List[rscpkg.RSC]) -> None:
-    '''Monitors the cloud enrollment process'''
+    def __init__(self, batches: List[Batch]) -> None:
+        self.batches = {rsc.address: batch for batch in batches for rsc in batch.rscs}
+        self.completed = {batch.number: 0 for batch in batches}
+        self.enrolled = {batch.number: 0 for batch in batches}
+
+    def complete(self, rsc: rscpkg.RSC) -> None:
+        '''Records that the enrollment of the RSC completed and prints its batch progress'''
+        batch = self.batches.get(rsc.address)
+        if batch is None:
+            return
+        self.completed[batch.number] += 1
+        if rsc.monitor_state == rscpkg.TaskState.SUCCESS:
+            self.enrolled[batch.number] += 1
+        print(f"Batch {batch.number}: {self.completed[batch.number]}/{len(batch.rscs)} complete,"
+              f" {self.enrolled[batch.number]} enrolled")
+
+def monitor_rscs(rscs_to_monitor: List[rscpkg.RSC], workers: int = DEFAULT_WORKERS,
+                 journal: Optional[Journal] = None,
+                 on_complete: Optional[Callable[[rscpkg.RSC], None]] = None) -> None:
+    '''Monitors the cloud enrollment process. Each RSC is polled on its own timer,
+    up to 'workers' RSCs at a time, so a slow RSC doesn't delay the others.
+    Final states are recorded in the journal, if any, and passed to 'on_complete'.'''
     in_prog_for_monitor = [rsc for rsc in rscs_to_monitor if rsc.monitor_state ==
                            rscpkg.TaskState.IN_PROGRESS and len(rsc.bind_monitor) > 0]
     if len(in_prog_for_monitor) != len(rscs_to_monitor):
@@ -68,25 +337,126 @@ def monitor_rscs(rscs_to_monitor: List[rscpkg.RSC]) -> None:
              " location or are not in a running state!")
             )
 
-    running = len(rscs_to_monitor)
     try:
-        while running > 0:
-            for rsc in rscs_to_monitor:
-                if rsc.monitor_state != rscpkg.TaskState.IN_PROGRESS:
-                    continue
-                try:
-                    if enrollment_complete(rsc):
-                        running -= 1
-                except rscpkg.RSCException as exp:
-                    logging.error(exp)
-            time.sleep(5)
+        poll_until_complete(rscs_to_monitor, workers, journal, on_complete)
     except KeyboardInterrupt:
-        print("Interrupted! Canceling enrollment...")
-        for rsc in rscs_to_monitor:
-            if rsc.monitor_state == rscpkg.TaskState.IN_PROGRESS:
-                cancel_enrollment(rsc)
-                print(f"Enrollment canceled for RSC '{rsc.address}'")
-                rsc.monitor_state = rscpkg.TaskState.CANCELLED
+        print("Interrupted! Canceling enrollment... Press CTRL+C again to exit right away.")
+        cancel_rscs(rscs_to_monitor, journal)
+
+def cancel_rscs(rscs: List[rscpkg.RSC], journal: Optional[Journal] = None,
+                workers: int = DEFAULT_CANCEL_WORKERS, timeout: float = CANCEL_TIMEOUT,
+                deadline: float = CANCEL_DEADLINE) -> List[rscpkg.RSC]:
+    '''Cancels the enrollment of the RSCs in progress, all at the same time. Each cancel
+    is sent once, bounded by 'timeout' seconds, and they are waited for 'deadline'
+    seconds at most. A second CTRL+C exits right away. RSCs whose cancel did not finish
+    stay IN_PROGRESS, with an error, and are recorded as such in the journal, if any,
+    so that a run resumed from it can monitor or cancel them again. Returns these RSCs.'''
+    to_cancel = [rsc for rsc in rscs if rsc.monitor_state == rscpkg.TaskState.IN_PROGRESS]
+    if not to_cancel:
+        return []
+
+    outcomes: Dict[int, Optional[Exception]] = {}
+    try:
+        run_with_deadline([functools.partial(rsc.cancel_enrollment, timeout, retry=False)
+                           for rsc in to_cancel], workers, deadline, outcomes)
+    except KeyboardInterrupt:
+        record_cancels(to_cancel, outcomes, journal, deadline)
+        print("Interrupted again! Exiting without waiting for the other cancels.")
+        sys.stdout.flush()
+        os._exit(130)  # pylint: disable=protected-access
+    return record_cancels(to_cancel, outcomes, journal, deadline)
+
+def record_cancels(rscs: List[rscpkg.RSC], outcomes: Dict[int, Optional[Exception]],
+                   journal: Optional[Journal], deadline: float) -> List[rscpkg.RSC]:
+    '''Records the outcome of the cancels of the RSCs, by index of the RSC, None for the
+    ones that succeeded. Returns the RSCs whose enrollment may still be pending.'''
+    pending = []
+    for index, rsc in enumerate(rscs):
+        if index in outcomes and outcomes[index] is None:
+            print(f"Enrollment canceled for RSC '{rsc.address}'")
+            rsc.monitor_state = rscpkg.TaskState.CANCELLED
+        else:
+            error = (str(outcomes[index]) if index in outcomes
+                     else f"cancel did not finish within {deadline} seconds")
+            rsc.add_error(f"Enrollment of RSC '{rsc.address}' may still be pending: {error}")
+            pending.append(rsc)
+        if journal:
+            journal.record(rsc, "cancel")
+    if pending:
+        print(f"Enrollment may still be pending for {len(pending)} RSC(s):")
+        for rsc in pending:
+            print("\t", rsc.address)
+        if journal:
+            print("Resume the run from the journal to monitor or cancel them.")
+    return pending
+
+def poll_until_complete(rscs: List[rscpkg.RSC], workers: int,
+                        journal: Optional[Journal] = None,
+                        on_complete: Optional[Callable[[rscpkg.RSC], None]] = None) -> None:
+    '''Polls the enrollment status of the RSCs until all of them are complete.
+    An RSC is polled again after the task monitor's Retry-After (see get_poll_interval).
+    Failed polls back off up to MONITOR_MAX_BACKOFF seconds.'''
+    now = time.monotonic()
+    started = now
+    due: List[Tuple[float, int]] = [(now, index) for index in range(len(rscs))]
+    failures = [0] * len(rscs)
+    polling: Dict[Future, int] = {}
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        while due or polling:
+            now = time.monotonic()
+            while due and due[0][0] <= now:
+                _, index = heapq.heappop(due)
+                polling[executor.submit(enrollment_complete, rscs[index])] = index
+
+            timeout = max(0.0, due[0][0] - now) if due else None
+            done, _ = wait(polling, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = polling.pop(future)
+                delay = get_next_poll(future, rscs[index], failures, index)
+                if delay is not None:
+                    heapq.heappush(due, (time.monotonic() + delay, index))
+                    continue
+                METRICS.observe_phase(rscs[index].address, "monitor",
+                                      time.monotonic() - started)
+                if journal:
+                    journal.record(rscs[index], "monitor")
+                if on_complete:
+                    on_complete(rscs[index])
+    finally:
+        # On an interrupt, polls in flight are not waited for, so cancels can start.
+        # The ones answering after their RSC was cancelled don't change its state.
+        for future in polling:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def get_next_poll(future: Future, rsc: rscpkg.RSC, failures: List[int],
+                  index: int) -> Optional[float]:
+    '''Handles the outcome of a poll of the RSC at 'index'. Returns the delay before
+    polling it again, or None if its enrollment is complete. The failed polls in a row
+    of each RSC are counted in 'failures'.'''
+    try:
+        if future.result():
+            return None
+    except rscpkg.RSCException as exp:
+        logging.error(exp)
+        failures[index] += 1
+        return get_backoff(failures[index])
+    failures[index] = 0
+    return get_poll_interval(rsc)
+
+def get_poll_interval(rsc: rscpkg.RSC) -> float:
+    '''Returns the delay before polling again an RSC whose enrollment is in progress:
+    the Retry-After of its task monitor, between MONITOR_MIN_INTERVAL and
+    MONITOR_MAX_BACKOFF seconds, or MONITOR_INTERVAL seconds if there is none'''
+    if rsc.bind_retry_after is None:
+        return MONITOR_INTERVAL
+    return max(MONITOR_MIN_INTERVAL, min(rsc.bind_retry_after, MONITOR_MAX_BACKOFF))
+
+def get_backoff(failures: int) -> float:
+    '''Returns the delay before polling again an RSC whose last polls failed'''
+    return min(MONITOR_INTERVAL * 2 ** failures, MONITOR_MAX_BACKOFF)
 
 def enrollment_complete(rsc: rscpkg.RSC) -> bool:
     '''Handles the enrollment task state of an RSC.
@@ -105,11 +475,3 @@ def enrollment_complete(rsc: rscpkg.RSC) -> bool:
         logging.info(
             "RSC '%s' was NOT enrolled successfully!", rsc.address)
     return True
-
-def cancel_enrollment(rsc) -> None:
-    '''Cancels the enrollment process for an RSC'''
-    if rsc.monitor_state == rscpkg.TaskState.IN_PROGRESS:
-        rsc.cancel_enrollment()
-        logging.info("RSC '%s' enrollment canceled", rsc.address)
-    else:
-        logging.info("RSC '%s' enrollment not in progress", rsc.address)
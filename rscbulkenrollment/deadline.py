@@ -0,0 +1,43 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Calls run at the same time and waited for up to a deadline'''
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def run_with_deadline(calls: List[Callable[[], None]], workers: int, deadline: float,
+                      outcomes: Dict[int, Optional[Exception]]) -> None:
+    '''Runs the calls, up to 'workers' at a time, and waits for them up to 'deadline'
+    seconds. The outcome of each call that finished is put in 'outcomes' by index of
+    the call, as it finishes: None if it succeeded, or the exception it raised.
+    The calls run on daemon threads, which, unlike the ones of an executor, are not
+    waited for when the process exits, so calls that don't finish don't hold it past
+    the deadline.'''
+    queued: "queue.Queue[int]" = queue.Queue()
+    for index in range(len(calls)):
+        queued.put(index)
+    finished: "queue.Queue[Tuple[int, Optional[Exception]]]" = queue.Queue()
+
+    def run_queued() -> None:
+        while True:
+            try:
+                index = queued.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                calls[index]()
+                finished.put((index, None))
+            except Exception as exp:  # pylint: disable=broad-exception-caught
+                finished.put((index, exp))
+
+    for _ in range(max(1, min(workers, len(calls)))):
+        threading.Thread(target=run_queued, daemon=True).start()
+    stop_at = time.monotonic() + deadline
+    while len(outcomes) < len(calls) and time.monotonic() < stop_at:
+        try:
+            index, error = finished.get(timeout=stop_at - time.monotonic())
+        except queue.Empty:
+            return
+        outcomes[index] = error
@@ -2,31 +2,50 @@
 # SPDX-License-Identifier: MIT
 '''Functions for importing RSCs from CSV files or lists'''
 import csv
+import ipaddress
 import logging
 from io import TextIOWrapper
-from typing import List, Union
+from typing import List, NamedTuple, Optional, Set, Tuple, Union
 
 from rscbulkenrollment.rsc import rsc as rscpkg
 
+CSV_DELIMITERS = ",;\t"
 
-def import_rscs(*, filename=None, rsc_list=None) -> List[rscpkg.RSC]:
-    '''Reads RSCs from the csv file and command line options and returns a list of RSCs'''
+
+class Credential(NamedTuple):
+    '''Passwords for the RSCs in a subnet. A 'network' of None applies to any RSC.'''
+    network: Optional[ipaddress.IPv4Network]
+    current_password: str
+    new_password: str
+
+
+def import_rscs(*, filename=None, rsc_list=None,
+                pool_size: int = rscpkg.DEFAULT_POOL_SIZE) -> List[rscpkg.RSC]:
+    '''Reads RSCs from the csv file and command line options and returns a list of RSCs,
+    each keeping up to 'pool_size' connections open. RSCs with the same address and
+    password as a previous one are skipped.'''
     logging.debug("Importing RSCs from file '%s' and list '%s'", filename, rsc_list)
-    result = []
+    result: List[rscpkg.RSC] = []
+    seen: Set[Tuple[str, str]] = set()
 
     if filename:
         with open(filename, 'r', newline='', encoding='utf-8-sig') as csvfile:
-            result.extend(get_rscs_from_csv(csvfile, guess_dialect(csvfile)))
+            result.extend(get_rscs_from_csv(csvfile, guess_dialect(csvfile), seen, pool_size))
     if rsc_list:
-        result.extend(get_rscs_from_csv(rsc_list))
+        result.extend(get_rscs_from_csv(rsc_list, seen=seen, pool_size=pool_size))
     return result
 
 def guess_dialect(csv_object: Union[TextIOWrapper, list]) -> csv.Dialect:
     '''Guesses the dialect of a csv object'''
     if isinstance(csv_object, TextIOWrapper):
         csv_object.seek(0)
-        dialect = csv.Sniffer().sniff(csv_object.read(1024))
+        sample = csv_object.read(1024)
         csv_object.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS)
+        except csv.Error:
+            logging.debug("Could not guess dialect, using default excel dialect.")
+            return csv.excel
         logging.debug("Guessed dialect. Separator: '%s', quotechar: '%s', escapechar: '%s', doublequote: '%s', lineterminator: '%s', quoting: '%s'",
             dialect.delimiter, dialect.quotechar, dialect.escapechar, dialect.doublequote, dialect.lineterminator, dialect.quoting)
         return dialect
@@ -34,24 +53,62 @@ def guess_dialect(csv_object: Union[TextIOWrapper, list]) -> csv.Dialect:
         logging.debug("No file to guess dialect from, using default excel dialect.")
         return csv.excel
 
-def get_rscs_from_csv(csv_object: Union[TextIOWrapper, list], dialect: csv.Dialect=csv.excel) -> List[rscpkg.RSC]:
-    '''Reads a csv object (text reader or list) and returns the list of RSCs contained there.'''
+def get_rscs_from_csv(csv_object: Union[TextIOWrapper, list], dialect: csv.Dialect=csv.excel,
+                      seen: Optional[Set[Tuple[str, str]]] = None,
+                      pool_size: int = rscpkg.DEFAULT_POOL_SIZE) -> List[rscpkg.RSC]:
+    '''Reads a csv object (text reader or list) and returns the list of RSCs contained there.
+    Rows whose address and current password are in 'seen' are skipped as duplicates;
+    the others are added to it.'''
+    if seen is None:
+        seen = set()
     rsc_list = []
 
     reader = csv.reader(csv_object, dialect=dialect)
-    line_no = 1
     for line in reader:
         if len(line) < 2:
             raise ValueError(
                 f"Error in line '{line}': need to have at least address and current password")
-        new_rsc = rscpkg.RSC(
-            line[0],
-            line[1],
-            line[2] if len(line) > 2 else ""
-        )
-        if new_rsc not in rsc_list:
-            rsc_list.append(new_rsc)
-        else:
-            logging.warning("Duplicate RSC found in CSV file line %d: %s", line_no, new_rsc)
-        line_no += 1
+        key = (line[0], line[1])
+        if key in seen:
+            logging.warning("Duplicate RSC found in CSV file line %d: %s",
+                            reader.line_num, line[0])
+            continue
+        seen.add(key)
+        rsc_list.append(rscpkg.RSC(line[0], line[1], line[2] if len(line) > 2 else "",
+                                   pool_size))
     return rsc_list
+
+def import_credentials(filename: str) -> List[Credential]:
+    '''Reads a credential csv file. Each line has a subnet (e.g. 192.168.0.0/24) or '*'
+    for any RSC, the current password and optionally a new password.'''
+    credentials = []
+    with open(filename, 'r', newline='', encoding='utf-8-sig') as csvfile:
+        reader = csv.reader(csvfile, dialect=guess_dialect(csvfile))
+        for line in reader:
+            if len(line) < 2:
+                raise ValueError(
+                    f"Error in line '{line}': need to have at least subnet and current password")
+            try:
+                network = None if line[0] == '*' else ipaddress.IPv4Network(line[0], strict=False)
+            except ValueError as exp:
+                raise ValueError(f"Error in line {reader.line_num}: {exp}") from exp
+            credentials.append(Credential(network, line[1], line[2] if len(line) > 2 else ""))
+    return credentials
+
+def find_credential(address: str, credentials: List[Credential]) -> Optional[Credential]:
+    '''Returns the credential of the most specific subnet containing the address,
+    the default credential if none does, or None if there isn't one either.'''
+    try:
+        ip_address = ipaddress.IPv4Address(address)
+    except ValueError:
+        ip_address = None
+    best = None
+    for credential in credentials:
+        if credential.network is None:
+            if best is None:
+                best = credential
+        elif ip_address is not None and ip_address in credential.network and (
+                best is None or best.network is None or
+                credential.network.prefixlen > best.network.prefixlen):
+            best = credential
+    return best
@@ -2,47 +2,99 @@
 # SPDX-License-Identifier: MIT
 '''Functions for discovering RSCs using zeroconf'''
 
-import time
-from typing import List, Union
+import asyncio
+from typing import Callable, Dict, List, Optional, Set
 import logging
-from zeroconf import ServiceBrowser, ServiceListener, Zeroconf, ServiceInfo
+from zeroconf import IPVersion, ServiceStateChange, Zeroconf
+from zeroconf.asyncio import AsyncServiceBrowser, AsyncServiceInfo, AsyncZeroconf
 from rscbulkenrollment.rsc import rsc as rscpkg
 
-infos = []
+SERVICE_TYPE = "_rsc._tcp.local."
+DISCOVERY_MAX_TIME = 10
+DISCOVERY_QUIET_TIME = 2
+RESOLVE_TIMEOUT_MS = 3000
 
-class MyListener(ServiceListener):
-    '''Listener for discovery'''
 
-    def __init__(self, rsc: List[rscpkg.RSC]) -> None:
-        self.rsc = rsc
+class RSCBrowser:
+    '''Browses RSC services, resolving each new service in its own task so that
+    a slow answer doesn't hold up the others. RSCs are kept by address, and passed
+    to 'on_found', if given, as soon as they are resolved.'''
 
-    def add_service(self, zc: Zeroconf, type_: str, name: str) -> None:
-        '''Listens to add service events'''
-        info: Union[ServiceInfo, None] = zc.get_service_info(type_, name)
+    def __init__(self, zeroconf: Zeroconf,
+                 on_found: Optional[Callable[[rscpkg.RSC], None]] = None) -> None:
+        self.zeroconf = zeroconf
+        self.on_found = on_found
+        self.names: Set[str] = set()
+        self.rscs: Dict[str, rscpkg.RSC] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.last_seen: Optional[float] = None
+
+    def on_service_state_change(self, zeroconf: Zeroconf, service_type: str, name: str,
+                                state_change: ServiceStateChange) -> None:
+        '''Starts resolving services seen for the first time'''
+        # pylint: disable=unused-argument
+        if state_change is not ServiceStateChange.Added or name in self.names:
+            return
+        self.names.add(name)
+        self.last_seen = asyncio.get_running_loop().time()
+        task = asyncio.ensure_future(self.resolve(service_type, name))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def resolve(self, service_type: str, name: str) -> None:
+        '''Resolves the address of a service and records its RSC'''
+        info = AsyncServiceInfo(service_type, name)
+        if not await info.async_request(self.zeroconf, RESOLVE_TIMEOUT_MS):
+            logging.debug("Could not resolve service '%s'", name)
+            return
         logging.debug("add_service: %s", info)
-        if (info is not None and
-            info.addresses is not None and
-            len(info.addresses) > 0):
-            self.rsc.append(rscpkg.RSC('.'.join([str(a) for a in info.addresses[0]]), "", ""))
-            logging.info("RSC service at '%s' discovered. Address: %s",
-                         info.server.rstrip('.') if info.server is not None else name,
-                         self.rsc[-1].address)
-
-    def remove_service(self, zc: Zeroconf, type_: str, name: str) -> None:
-        '''Listens to remove service events'''
-
-    def update_service(self, zc: Zeroconf, type_: str, name: str) -> None:
-        '''Listens to update service events'''
-
-def discover_rscs() -> List[rscpkg.RSC]:
-    '''Discovers RSCs using zeroconf'''
-    rsc: List[rscpkg.RSC] = []
-    zeroconf = Zeroconf()
-    listener = MyListener(rsc)
-    browser = ServiceBrowser(zeroconf, "_rsc._tcp.local.", listener)
+        addresses = info.parsed_addresses(IPVersion.V4Only)
+        if not addresses:
+            return
+        self.last_seen = asyncio.get_running_loop().time()
+        if addresses[0] in self.rscs:
+            return
+        self.rscs[addresses[0]] = rscpkg.RSC(addresses[0], "", "")
+        logging.info("RSC service at '%s' discovered. Address: %s",
+                     info.server.rstrip('.') if info.server is not None else name,
+                     addresses[0])
+        if self.on_found:
+            self.on_found(self.rscs[addresses[0]])
+
+    def is_quiet(self, quiet_time: float) -> bool:
+        '''True if nothing is being resolved and nothing new arrived for 'quiet_time' seconds
+        since the last answer. Never True before the first answer, as RSCs may take a
+        while to answer at all.'''
+        return (self.last_seen is not None and not self.tasks and
+                asyncio.get_running_loop().time() - self.last_seen >= quiet_time)
+
+
+async def discover_rscs_async(max_time: float = DISCOVERY_MAX_TIME,
+                              quiet_time: float = DISCOVERY_QUIET_TIME,
+                              on_found: Optional[Callable[[rscpkg.RSC], None]] = None
+                              ) -> List[rscpkg.RSC]:
+    '''Discovers RSCs using zeroconf. Stops once no new RSC showed up for 'quiet_time'
+    seconds after the last one, or after 'max_time' seconds. 'on_found' is called from the
+    event loop with each RSC as soon as it is discovered, so it must not block.'''
+    aiozc = AsyncZeroconf()
+    loop = asyncio.get_running_loop()
+    stop_at = loop.time() + max_time
+    rsc_browser = RSCBrowser(aiozc.zeroconf, on_found)
+    browser = AsyncServiceBrowser(aiozc.zeroconf, [SERVICE_TYPE],
+                                  handlers=[rsc_browser.on_service_state_change])
     try:
-        time.sleep(5)
-        browser.cancel()
+        while loop.time() < stop_at and not rsc_browser.is_quiet(quiet_time):
+            await asyncio.sleep(0.1)
     finally:
-        zeroconf.close()
-    return rsc
+        await browser.async_cancel()
+        for task in list(rsc_browser.tasks):
+            task.cancel()
+        await aiozc.async_close()
+    return list(rsc_browser.rscs.values())
+
+def discover_rscs(max_time: float = DISCOVERY_MAX_TIME,
+                  quiet_time: float = DISCOVERY_QUIET_TIME,
+                  on_found: Optional[Callable[[rscpkg.RSC], None]] = None
+                  ) -> List[rscpkg.RSC]:
+    '''Discovers RSCs using zeroconf. See discover_rscs_async.'''
+    return asyncio.run(discover_rscs_async(max_time, quiet_time, on_found))
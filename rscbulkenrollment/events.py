@@ -0,0 +1,57 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Stream of machine-readable RSC events, one JSON object per line'''
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from typing import Any, Iterator, Optional, TextIO
+
+
+class EventStream:
+    '''Thread-safe writer of NDJSON events. Events are written and flushed as they
+    happen, so they can be consumed while the run goes on. Nothing is written
+    until an output is opened.'''
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.file: Optional[TextIO] = None
+
+    def emit(self, event: str, address: str, **fields: Any) -> None:
+        '''Writes an event of the RSC at 'address' with the given fields'''
+        if self.file is None:
+            return
+        line = json.dumps({"time": round(time.time(), 3), "event": event,
+                           "address": address, **fields})
+        with self.lock:
+            if self.file is not None:
+                self.file.write(line + "\n")
+                self.file.flush()
+
+    @contextmanager
+    def output(self, filename: Optional[str]) -> Iterator[None]:
+        '''Writes the events of the block to 'filename', if given. With '-', events
+        are written to stdout and the rest of the output goes to stderr.'''
+        if not filename:
+            yield
+            return
+        if filename == "-":
+            self.file = sys.stdout
+            try:
+                with redirect_stdout(sys.stderr):
+                    yield
+            finally:
+                with self.lock:
+                    self.file = None
+            return
+        with open(filename, 'a', encoding='utf-8') as events_file:
+            self.file = events_file
+            try:
+                yield
+            finally:
+                with self.lock:
+                    self.file = None
+
+
+EVENTS = EventStream()
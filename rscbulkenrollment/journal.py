@@ -0,0 +1,93 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Append-only journal of a bulk enrollment run, used to resume interrupted runs'''
+import json
+import logging
+import threading
+from typing import Dict, List
+
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+COMPLETED_STATES = (rscpkg.TaskState.SUCCESS, rscpkg.TaskState.ALREADY_ENROLLED)
+
+
+class Journal:
+    '''JSON lines file with one record per RSC state change, the last record of an RSC
+    being its current state. Records are flushed as they are written, so a crashed
+    run leaves a usable journal behind. Passwords are never written.'''
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.file = open(filename, 'a', encoding='utf-8') # pylint: disable=consider-using-with
+
+    def record(self, rsc: rscpkg.RSC, stage: str) -> None:
+        '''Appends the state of the RSC at the end of 'stage' ("password", "enroll",
+        "monitor" or "cancel"). Records made once the journal is closed are dropped,
+        and logged.'''
+        line = json.dumps({
+            "address": rsc.address,
+            "stage": stage,
+            "state": rsc.monitor_state.name,
+            "bind_monitor": rsc.bind_monitor,
+            "user_code": rsc.user_code,
+            "password_changed": rsc.current_password != rsc.old_password,
+        })
+        with self.lock:
+            if self.file.closed:
+                logging.warning("Journal '%s' is closed, not recording: %s", self.filename,
+                                line)
+                return
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self) -> None:
+        '''Closes the journal file'''
+        with self.lock:
+            self.file.close()
+
+
+def load_journal(filename: str) -> Dict[str, Dict]:
+    '''Reads a journal and returns the last record of each RSC by address.
+    A missing journal has no records. Invalid lines, such as one cut short
+    by a crash, are skipped.'''
+    entries: Dict[str, Dict] = {}
+    try:
+        with open(filename, 'r', encoding='utf-8') as journal_file:
+            for line_no, line in enumerate(journal_file, 1):
+                try:
+                    entry = json.loads(line)
+                    entries[entry["address"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    logging.warning("Ignoring invalid line %d of journal '%s'", line_no, filename)
+    except FileNotFoundError:
+        logging.info("Journal '%s' not found, nothing to resume", filename)
+    return entries
+
+
+def resume_rscs(rscs: List[rscpkg.RSC], entries: Dict[str, Dict]) -> List[rscpkg.RSC]:
+    '''Restores the state recorded in the journal entries to the RSCs.
+    RSCs whose enrollment completed keep their final state, so they can be skipped.
+    Returns the RSCs whose enrollment was in progress and have to be monitored.'''
+    to_monitor = []
+    for rsc in rscs:
+        entry = entries.get(rsc.address)
+        if entry is None:
+            continue
+        try:
+            state = rscpkg.TaskState[entry["state"]]
+        except KeyError:
+            continue
+
+        if entry.get("password_changed") and rsc.new_password:
+            rsc.current_password = rsc.new_password
+            rsc.password_change_required = False
+
+        if state in COMPLETED_STATES:
+            rsc.monitor_state = state
+        elif state == rscpkg.TaskState.IN_PROGRESS and entry.get("bind_monitor"):
+            rsc.bind_monitor = entry["bind_monitor"]
+            rsc.user_code = entry.get("user_code") or ""
+            rsc.monitor_state = state
+            to_monitor.append(rsc)
+    return to_monitor
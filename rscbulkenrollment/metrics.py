@@ -0,0 +1,203 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Timing of RSC requests and enrollment phases, exported as JSON or Prometheus text'''
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+PROMETHEUS_INTERVAL = 15
+
+
+class Histogram:
+    '''Distribution of durations in seconds, with Prometheus-style buckets'''
+    __slots__ = ('bucket_counts', 'count', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        '''Adds a duration'''
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        '''Returns (upper bound, count of durations up to it) pairs, ending with +Inf'''
+        result = []
+        running = 0
+        for bound, count in zip(BUCKETS, self.bucket_counts):
+            running += count
+            result.append((str(bound), running))
+        result.append(("+Inf", self.count))
+        return result
+
+    def to_dict(self) -> Dict:
+        '''Summary of the histogram for the JSON export'''
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class Metrics:
+    '''Thread-safe collection of request latencies by operation, error classes, retries
+    and enrollment phase durations, overall and per RSC'''
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests: Dict[str, Histogram] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.retries: Dict[str, int] = {}
+        self.phases: Dict[str, Histogram] = {}
+        self.devices: Dict[str, Dict[str, float]] = {}
+
+    def observe_request(self, operation: str, seconds: float,
+                        error: Optional[str] = None) -> None:
+        '''Records the duration of a request for 'operation' and its error class, if any'''
+        with self.lock:
+            self.requests.setdefault(operation, Histogram()).observe(seconds)
+            if error:
+                self.errors[(operation, error)] = self.errors.get((operation, error), 0) + 1
+
+    def count_retry(self, operation: str) -> None:
+        '''Records that a request for 'operation' was sent again'''
+        with self.lock:
+            self.retries[operation] = self.retries.get(operation, 0) + 1
+
+    def observe_phase(self, address: str, phase: str, seconds: float) -> None:
+        '''Records how long an RSC spent in an enrollment phase'''
+        with self.lock:
+            self.phases.setdefault(phase, Histogram()).observe(seconds)
+            device = self.devices.setdefault(address, {})
+            device[phase] = round(device.get(phase, 0.0) + seconds, 6)
+
+    @contextmanager
+    def phase(self, address: str, phase: str) -> Iterator[None]:
+        '''Times the block as an enrollment phase of the RSC, whether it fails or not'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(address, phase, time.perf_counter() - start)
+
+    def summary(self) -> Dict:
+        '''Returns all metrics as a JSON serializable dictionary'''
+        with self.lock:
+            return {
+                "requests": {op: hist.to_dict() for op, hist in self.requests.items()},
+                "errors": [{"operation": op, "error": error, "count": count}
+                           for (op, error), count in self.errors.items()],
+                "retries": dict(self.retries),
+                "phases": {phase: hist.to_dict() for phase, hist in self.phases.items()},
+                "devices": {address: dict(phases) for address, phases in self.devices.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        '''Returns the metrics, except the per RSC ones, in Prometheus text format'''
+        lines = []
+        with self.lock:
+            lines += histogram_lines("rsc_request_duration_seconds",
+                                     "Duration of Redfish requests by operation",
+                                     "operation", self.requests)
+            lines.append("# HELP rsc_request_errors_total Failed Redfish requests by error")
+            lines.append("# TYPE rsc_request_errors_total counter")
+            for (operation, error), count in self.errors.items():
+                lines.append(f'rsc_request_errors_total{{operation="{escape(operation)}",'
+                             f'error="{escape(error)}"}} {count}')
+            lines.append("# HELP rsc_request_retries_total Redfish requests sent again")
+            lines.append("# TYPE rsc_request_retries_total counter")
+            for operation, count in self.retries.items():
+                lines.append(f'rsc_request_retries_total{{operation="{escape(operation)}"}}'
+                             f' {count}')
+            lines += histogram_lines("rsc_phase_duration_seconds",
+                                     "Time RSCs spent in each enrollment phase",
+                                     "phase", self.phases)
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, filename: str) -> None:
+        '''Writes the JSON summary to a file'''
+        with open(filename, 'w', encoding='utf-8') as metrics_file:
+            json.dump(self.summary(), metrics_file, indent=2)
+
+    def write_prometheus(self, filename: str) -> None:
+        '''Writes the Prometheus text export to a file, replacing it atomically'''
+        temp_filename = filename + ".tmp"
+        with open(temp_filename, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(self.to_prometheus())
+        os.replace(temp_filename, filename)
+
+
+def histogram_lines(name: str, description: str, label: str,
+                    histograms: Dict[str, Histogram]) -> List[str]:
+    '''Prometheus text lines of histograms by label value'''
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+    for value, hist in histograms.items():
+        label_value = escape(value)
+        for bound, count in hist.cumulative():
+            lines.append(f'{name}_bucket{{{label}="{label_value}",le="{bound}"}} {count}')
+        lines.append(f'{name}_sum{{{label}="{label_value}"}} {hist.total}')
+        lines.append(f'{name}_count{{{label}="{label_value}"}} {hist.count}')
+    return lines
+
+def escape(value: str) -> str:
+    '''Escapes a Prometheus label value'''
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+
+
+class MetricsExporter:
+    '''Context manager that writes METRICS when the block exits: the JSON summary to
+    'json_filename' and the Prometheus text to 'prometheus_filename', if given.
+    The Prometheus file is also refreshed every 'interval' seconds meanwhile.'''
+
+    def __init__(self, json_filename: Optional[str] = None,
+                 prometheus_filename: Optional[str] = None,
+                 interval: float = PROMETHEUS_INTERVAL) -> None:
+        self.json_filename = json_filename
+        self.prometheus_filename = prometheus_filename
+        self.interval = interval
+        self.stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'MetricsExporter':
+        if self.prometheus_filename:
+            self.thread = threading.Thread(target=self.refresh, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop.set()
+        if self.thread:
+            self.thread.join()
+        try:
+            if self.prometheus_filename:
+                METRICS.write_prometheus(self.prometheus_filename)
+            if self.json_filename:
+                METRICS.write_json(self.json_filename)
+        except OSError as exp:
+            logging.error("Failed to write metrics: %s", exp)
+
+    def refresh(self) -> None:
+        '''Rewrites the Prometheus file every interval until stopped'''
+        while not self.stop.wait(self.interval):
+            try:
+                METRICS.write_prometheus(self.prometheus_filename)
+            except OSError as exp:
+                logging.error("Failed to write metrics: %s", exp)
@@ -2,47 +2,88 @@
 # SPDX-License-Identifier: MIT
 '''Functions that handle RSC password changes and validation'''
 
+import json
 import logging
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple
+from rscbulkenrollment.metrics import METRICS
 from rscbulkenrollment.rsc import rsc as rscpkg
 
-def change_rsc_passwords(rscs: List[rscpkg.RSC]) -> bool:
-    '''Changes the password for the RSCs passed in. Returns True if all RSCs'
-    passwords were successfully changed. False otherwise.'''
-    changed_all = True
+DEFAULT_PASSWORD_WORKERS = 8
 
-    for rsc in rscs:
-        try:
-            logging.info("Logging in '%s'", rsc.address)
-            rsc.login()
-            logging.info("Changing password for '%s'", rsc.address)
+
+class PasswordOutcome(NamedTuple):
+    '''Outcome of the password change of an RSC'''
+    address: str
+    changed: bool
+    verified: bool
+    error: str
+
+
+def change_rsc_passwords(rscs: List[rscpkg.RSC],
+                         workers: int = DEFAULT_PASSWORD_WORKERS) -> List[PasswordOutcome]:
+    '''Changes the password for the RSCs passed in, up to 'workers' RSCs at a time,
+    and checks each new password by logging in with it.
+    Returns the outcome for each RSC, in the same order they were passed in.'''
+    if not rscs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(rscs)))) as executor:
+        return list(executor.map(change_rsc_password, rscs))
+
+def change_rsc_password(rsc: rscpkg.RSC) -> PasswordOutcome:
+    '''Changes the password of an RSC, reusing its session if it is logged in, and
+    logs in with the new password to check it'''
+    changed = False
+    try:
+        if not rsc.new_password:
+            raise rscpkg.RSCException(f"No new password was specified for RSC '{rsc.address}'")
+        logging.info("Changing password for '%s'", rsc.address)
+        with METRICS.phase(rsc.address, "password"):
             rsc.change_password()
-            print(f"Changed password for RSC '{rsc.address}'")
-        except rscpkg.RSCException as exp:
-            print(exp)
-            changed_all = False
-    return changed_all
+        changed = True
+        with METRICS.phase(rsc.address, "verify password"):
+            rsc.login()
+            rsc.logout()
+        print(f"Changed password for RSC '{rsc.address}'")
+        return PasswordOutcome(rsc.address, True, True, "")
+    except rscpkg.RSCException as exp:
+        print(exp)
+        rsc.add_error(str(exp))
+        return PasswordOutcome(rsc.address, changed, False, str(exp))
 
-def validate_rsc_passwords(rscs: List[rscpkg.RSC]) -> bool:
+def write_password_outcomes(filename: str, outcomes: List[PasswordOutcome]) -> None:
+    '''Writes the outcome of the password changes to a JSON lines file, one line per RSC.
+    Passwords are never written.'''
+    with open(filename, 'w', encoding='utf-8') as results_file:
+        for outcome in outcomes:
+            results_file.write(json.dumps(outcome._asdict()) + "\n")
+
+def validate_rsc_passwords(rscs: List[rscpkg.RSC],
+                           workers: int = DEFAULT_PASSWORD_WORKERS) -> bool:
     '''Validates if RSCs' current passwords work and whether they need to be changed.
-    If that's the case, checks if a new password was specified.
-    Returns True if all RSCs pass the checks.'''
-    result = True
-    for rsc in rscs:
-        logging.info("Logging in '%s'", rsc.address)
+    If that's the case, checks if a new password was specified. Up to 'workers' RSCs
+    are validated at a time. Returns True if all RSCs pass the checks.'''
+    if not rscs:
+        return True
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(rscs)))) as executor:
+        return all(list(executor.map(validate_rsc_password, rscs)))
 
-        try:
-            rsc.login()
-            logging.info("Current password ok for '%s'", rsc.address)
-            needs_password_change = rsc.check_needs_change_password()
-            if needs_password_change:
-                logging.info("RSC '%s' needs password change.",
-                             rsc.address)
-                if not rsc.new_password:
-                    logging.error("RSC '%s' needs password change,\
-                                but no new password was specified for it", rsc.address)
-                    result = False
-        except rscpkg.RSCException as exp:
-            logging.error(exp)
-            result = False
-    return result
+def validate_rsc_password(rsc: rscpkg.RSC) -> bool:
+    '''Validates the current password of an RSC, and that a new password was specified
+    if it needs to be changed. The session is kept for the steps that follow.'''
+    logging.info("Logging in '%s'", rsc.address)
+    try:
+        rsc.login()
+        logging.info("Current password ok for '%s'", rsc.address)
+        needs_password_change = rsc.check_needs_change_password()
+        if needs_password_change:
+            logging.info("RSC '%s' needs password change.",
+                         rsc.address)
+            if not rsc.new_password:
+                logging.error("RSC '%s' needs password change,\
+                            but no new password was specified for it", rsc.address)
+                return False
+        return True
+    except rscpkg.RSCException as exp:
+        logging.error(exp)
+        return False
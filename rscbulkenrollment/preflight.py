@@ -0,0 +1,45 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Pre-flight reachability check of RSCs, done before logging in to any of them'''
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from rscbulkenrollment.metrics import METRICS
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+PREFLIGHT_TIMEOUT = 3
+DEFAULT_PREFLIGHT_WORKERS = 64
+
+
+def check_rscs_reachable(rscs: List[rscpkg.RSC], workers: int = DEFAULT_PREFLIGHT_WORKERS,
+                         timeout: float = PREFLIGHT_TIMEOUT) -> List[rscpkg.RSC]:
+    '''Checks that the Redfish service root of every RSC answers within 'timeout' seconds,
+    up to 'workers' RSCs at a time. RSCs that don't are marked UNREACHABLE, with the
+    reason in their errors, so later phases skip them.
+    Returns the reachable RSCs, in the same order they were passed in.'''
+    def check(rsc: rscpkg.RSC) -> bool:
+        try:
+            with METRICS.phase(rsc.address, "preflight"):
+                rsc.check_service_root(timeout)
+            return True
+        except rscpkg.RSCException as exp:
+            logging.info(exp)
+            rsc.add_error(str(exp))
+            rsc.monitor_state = rscpkg.TaskState.UNREACHABLE
+            return False
+
+    if not rscs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(rscs)))) as executor:
+        reachable = list(executor.map(check, rscs))
+    return [rsc for rsc, ok in zip(rscs, reachable) if ok]
+
+def print_unreachable(rscs: List[rscpkg.RSC]) -> None:
+    '''Prints how many RSCs are reachable and a table of the unreachable ones'''
+    unreachable = [rsc for rsc in rscs if rsc.monitor_state == rscpkg.TaskState.UNREACHABLE]
+    print(f"Pre-flight check: {len(rscs) - len(unreachable)} of {len(rscs)} RSCs reachable")
+    if unreachable:
+        print("Unreachable RSCs will be skipped:")
+        for rsc in unreachable:
+            print("\t", rsc.address, ":", rsc.errors[-1] if rsc.errors else "")
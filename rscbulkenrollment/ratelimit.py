@@ -0,0 +1,108 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Token bucket rate limiting of the requests sent to RSCs'''
+import ipaddress
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_SUBNET_PREFIX = 24
+IPV6_SUBNET_PREFIX = 64
+
+
+class TokenBucket:
+    '''Allows 'rate' requests per second on average, with bursts of up to 'burst'
+    requests. Thread-safe.'''
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        '''Takes a token and returns the seconds to wait until it is available.
+        Tokens are handed out in order, so waiting callers are served first come,
+        first served.'''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class RateLimiter:
+    '''Limits the requests sent to RSCs: overall, per subnet of the RSC address and per
+    operation. Limits that are not set don't apply.'''
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.global_bucket: Optional[TokenBucket] = None
+        self.subnet_rate: Optional[float] = None
+        self.subnet_prefix = DEFAULT_SUBNET_PREFIX
+        self.subnets: Dict[str, TokenBucket] = {}
+        self.operations: Dict[str, TokenBucket] = {}
+
+    def configure(self, rate: Optional[float] = None, subnet_rate: Optional[float] = None,
+                  subnet_prefix: int = DEFAULT_SUBNET_PREFIX,
+                  operation_rates: Optional[Dict[str, float]] = None) -> None:
+        '''Sets the requests per second allowed overall, per subnet of 'subnet_prefix'
+        bits and per operation name. None removes a limit.'''
+        with self.lock:
+            self.global_bucket = TokenBucket(rate) if rate else None
+            self.subnet_rate = subnet_rate
+            self.subnet_prefix = subnet_prefix
+            self.subnets = {}
+            self.operations = {operation: TokenBucket(op_rate)
+                               for operation, op_rate in (operation_rates or {}).items()}
+
+    def acquire(self, address: str, operation: str) -> float:
+        '''Waits until a request for 'operation' can be sent to the RSC at 'address'.
+        Returns the seconds waited.'''
+        wait = self.reserve(address, operation)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def reserve(self, address: str, operation: str) -> float:
+        '''Takes a token for a request of 'operation' to the RSC at 'address' and returns
+        the seconds to wait before sending it, for callers that can't block'''
+        return max((bucket.reserve() for bucket in self.buckets(address, operation)),
+                   default=0.0)
+
+    def buckets(self, address: str, operation: str) -> List[TokenBucket]:
+        '''Token buckets that apply to a request'''
+        with self.lock:
+            buckets = [self.global_bucket] if self.global_bucket else []
+            if operation in self.operations:
+                buckets.append(self.operations[operation])
+            if self.subnet_rate:
+                subnet = get_subnet(address, self.subnet_prefix)
+                if subnet:
+                    if subnet not in self.subnets:
+                        self.subnets[subnet] = TokenBucket(self.subnet_rate)
+                    buckets.append(self.subnets[subnet])
+            return buckets
+
+
+def get_subnet(address: str, prefix: int) -> Optional[str]:
+    '''Returns the subnet of 'prefix' bits of an RSC address, ignoring its port.
+    IPv6 addresses use a /64 subnet. Returns None for host names.'''
+    host = address
+    if host.startswith("["):
+        host = host[1:].split("]")[0]
+    elif host.count(":") == 1:
+        host = host.split(":")[0]
+    try:
+        ip_address = ipaddress.ip_address(host)
+    except ValueError:
+        return None
+    if ip_address.version == 6:
+        prefix = IPV6_SUBNET_PREFIX
+    return str(ipaddress.ip_network(f"{ip_address}/{prefix}", strict=False))
+
+
+RATE_LIMITER = RateLimiter()
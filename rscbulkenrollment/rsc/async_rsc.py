@@ -0,0 +1,363 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''asyncio RSC client.
+
+All AsyncRSC objects of a run share one aiohttp ClientSession, and therefore one event
+loop and one connection pool, so a single process can keep thousands of RSC sessions
+in flight without a thread per RSC.'''
+import asyncio
+import logging
+import time
+from typing import (Any, Awaitable, Dict, Iterable, List, Mapping, NamedTuple, Optional,
+                    TypeVar, Union)
+import aiohttp
+
+from rscbulkenrollment.events import EVENTS
+from rscbulkenrollment.metrics import METRICS
+from rscbulkenrollment.ratelimit import RATE_LIMITER
+from rscbulkenrollment.rsc.rsc import (ACCOUNT_ENDPOINT, BASE_URL, BIND_TO_CLOUD_ENDPOINT,
+                                       CHANGE_PROXY_NTP_ENDPOINT, DEFAULT_TIMEOUT,
+                                       LOGIN_ENDPOINT, MANAGER_ENDPOINT, MANAGER_SELECT,
+                                       RETRY_POLICIES, SELECT_REJECTED_STATUSES,
+                                       SESSION_ENDPOINT, SETTINGS_POLL_INTERVAL,
+                                       SETTINGS_READY_TIMEOUT, TOKEN_HEADER_NAME,
+                                       RetryPolicy, RSC, RSCException, TaskState,
+                                       decode_body, get_binding_status, get_message_from_body,
+                                       get_proxy_ntp_settings, get_retry_delay, is_retryable,
+                                       settings_applied)
+
+DEFAULT_CONNECTION_LIMIT = 1000
+
+T = TypeVar('T')
+
+
+class AsyncResponse(NamedTuple):
+    '''Status, headers and decoded JSON body (None if there is none) of a response'''
+    status_code: int
+    headers: Mapping[str, str]
+    body: Optional[Any]
+
+    @property
+    def ok(self) -> bool:  # pylint: disable=invalid-name
+        '''True if the status code is a success, like requests.Response.ok'''
+        return self.status_code < 400
+
+
+def create_http_session(limit: int = DEFAULT_CONNECTION_LIMIT,
+                        timeout: float = DEFAULT_TIMEOUT) -> aiohttp.ClientSession:
+    '''Creates the ClientSession shared by all AsyncRSCs. Has to be called
+    from a running event loop.'''
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=limit, ssl=False),
+        timeout=aiohttp.ClientTimeout(total=timeout))
+
+
+async def gather_bounded(aws: Iterable[Awaitable[T]],
+                         limit: int) -> List[Union[T, BaseException]]:
+    '''Runs the awaitables with at most 'limit' of them at the same time.
+    Returns results (or the exceptions raised) in the same order.'''
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def bounded(awaitable: Awaitable[T]) -> T:
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*[bounded(aw) for aw in aws], return_exceptions=True)
+
+
+def is_retryable_error(policy: RetryPolicy, exception: BaseException) -> bool:
+    '''Returns whether a request that raised 'exception' can be sent again. Failures to
+    connect can always be retried, other failures only for idempotent operations.'''
+    return isinstance(exception, aiohttp.ClientConnectorError) or policy.idempotent
+
+
+class AsyncRSC:
+    '''asyncio counterpart of the RSC class, with the same operations, retries, circuit
+    breaker, rate limits, metrics and events. Works on the state of an RSC object
+    (passwords, enrollment monitor, user code and task state), so results are
+    seen by the rest of the tool as if the blocking client had been used.'''
+
+    def __init__(self, rsc: RSC, http: aiohttp.ClientSession) -> None:
+        self.rsc = rsc
+        self.http = http
+        self.token = ""
+        self.session_id = ""
+
+    @property
+    def address(self) -> str:
+        '''Address of the RSC'''
+        return self.rsc.address
+
+    async def close(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        '''Logs out of the session, if any. The shared ClientSession is left open.'''
+        if self.session_id:
+            await self.logout(timeout)
+
+    async def login(self) -> None:
+        '''logs in to the RSC and sets its session token if successful.
+        An existing session is reused, so phases of a run share one session.'''
+        if self.session_id:
+            return
+        url = LOGIN_ENDPOINT % self.address
+        try:
+            response = await self.send_with_retries(
+                'POST', url, "login", DEFAULT_TIMEOUT,
+                json={"UserName": "admin", "Password": self.rsc.current_password})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            logging.debug("login failed with exception: %s", ex)
+            raise RSCException(f"Failed login on RSC  {self.address}: {ex}") from ex
+        try:
+            if not response.ok:
+                raise ValueError(f"HTTP {response.status_code}")
+            self.session_id = response.body['Id']
+            self.token = response.headers[TOKEN_HEADER_NAME]
+        except (KeyError, TypeError, ValueError) as ex:
+            logging.debug("login failed with exception: %s", ex)
+            raise RSCException(f"Failed login on RSC  {self.address}: "
+                               f"{self.get_error_message(response)}",
+                               response.status_code) from ex
+        EVENTS.emit("logged_in", self.address)
+
+    async def logout(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        '''Logs out of the session'''
+        try:
+            await self.do_req_handle_exceptions(
+                'DELETE', SESSION_ENDPOINT % (self.address, self.session_id), "logout",
+                relogin=False, timeout=timeout)
+        finally:
+            self.drop_session()
+
+    def drop_session(self) -> None:
+        '''Forgets the current session token without logging out'''
+        self.token = ""
+        self.session_id = ""
+
+    async def check_service_root(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        '''Checks that the Redfish service of the RSC answers, without logging in, and
+        whether it supports the $select query'''
+        operation = "check service root"
+        response = await self.do_req_handle_exceptions(
+            'GET', BASE_URL % self.address, operation, relogin=False, timeout=timeout)
+        self.rsc.record_service_root(self.get_body(response, operation))
+
+    async def check_needs_change_password(self) -> bool:
+        '''Checks if the password needs to be changed (is still the default password) '''
+        operation = "check if password needs change"
+        response = await self.do_req_handle_exceptions(
+            'GET', ACCOUNT_ENDPOINT % self.address, operation)
+        self.rsc.password_change_required = \
+            self.get_body(response, operation)["PasswordChangeRequired"]
+        return self.rsc.password_change_required
+
+    async def change_password(self) -> None:
+        '''Changes password for this RSC, logging in if needed.
+        Sets the current password if successful. The session used for the change
+        is logged out, as the RSC only allows password changes on it.'''
+        await self.login()
+        await self.do_req_handle_exceptions(
+            'PATCH', ACCOUNT_ENDPOINT % self.address, "change password",
+            json={"Password": self.rsc.new_password})
+        self.rsc.record_password_changed()
+        try:
+            await self.logout()
+        except RSCException as exp:
+            logging.debug("logout after password change failed: %s", exp)
+
+    async def enroll_to_cloud(self, check_enrolled: bool = True) -> None:
+        '''Invokes enroll to cloud to given RSC and records the task monitor
+        for the operation and user code. Pass 'check_enrolled' as False if the caller
+        already checked that the RSC is not enrolled.'''
+        if check_enrolled and await self.is_enrolled_to_cloud():
+            return
+        operation = "enroll to cloud"
+        response = await self.do_req_handle_exceptions(
+            'POST', BIND_TO_CLOUD_ENDPOINT % self.address, operation)
+        self.rsc.record_bind_started(response.headers["Location"],
+                                     self.get_body(response, operation)["User_code"])
+
+    async def is_enrolled_to_cloud(self) -> bool:
+        '''Checks if the RSC is already enrolled to cloud'''
+        return self.rsc.record_manager(await self.read_manager())
+
+    async def read_manager(self) -> Dict:
+        '''Gets the Managers/1 resource of this RSC, with the $select query if the RSC
+        supports it, like RSC.read_manager'''
+        operation = "is enrolled to cloud"
+        if self.rsc.select_supported:
+            url = f"{MANAGER_ENDPOINT % self.address}?$select={MANAGER_SELECT}"
+            try:
+                response = await self.do_req_handle_exceptions('GET', url, operation)
+                body = self.get_body(response, operation)
+                if get_binding_status(body) is not None:
+                    return body
+            except RSCException as exp:
+                if exp.status_code not in SELECT_REJECTED_STATUSES:
+                    raise
+            logging.debug("RSC '%s' does not handle $select, reading the full resource",
+                          self.address)
+            self.rsc.select_supported = False
+        response = await self.do_req_handle_exceptions(
+            'GET', MANAGER_ENDPOINT % self.address, operation)
+        return self.get_body(response, operation)
+
+    async def get_bind_status(self) -> TaskState:
+        '''Updates and returns the task state for the monitor of cloud enrollment for this RSC'''
+        if not self.rsc.bind_monitor:
+            raise RSCException("RSC not in the process of enrollment to cloud")
+
+        response = await self.do_req_handle_exceptions(
+            'GET', f"https://{self.address}{self.rsc.bind_monitor}", "get enrollment status")
+        logging.debug("get_bind_status RSC '%s' code: %d response: %s",
+                      self.address, response.status_code, response.body)
+        return self.rsc.record_bind_status(response.status_code,
+                                           response.headers.get("Retry-After"))
+
+    async def set_proxy_ntp_settings(self, proxy_address: str, ntp_server: str,
+                                     ready_timeout: float = SETTINGS_READY_TIMEOUT,
+                                     current: Optional[Dict] = None) -> bool:
+        '''Sets NTP and proxy settings to this RSC, unless it already has them.
+        The settings are read from the RSC unless the 'current' ones are given.
+        After a change, waits up to 'ready_timeout' seconds for the RSC to report the
+        new settings. Returns True if the settings were changed.'''
+        settings = get_proxy_ntp_settings(proxy_address, ntp_server)
+        if not settings:
+            return False
+        if current is None:
+            current = await self.read_proxy_ntp_settings()
+        if settings_applied(current, settings):
+            return False
+        await self.do_req_handle_exceptions(
+            'PATCH', CHANGE_PROXY_NTP_ENDPOINT % self.address, "set proxy/NTP settings",
+            json=settings)
+
+        deadline = time.monotonic() + ready_timeout
+        confirmed = True
+        while not settings_applied(await self.read_proxy_ntp_settings(), settings):
+            if time.monotonic() >= deadline:
+                logging.warning("RSC '%s' does not report the new proxy/NTP settings after"
+                                " %g seconds, continuing", self.address, ready_timeout)
+                confirmed = False
+                break
+            await asyncio.sleep(SETTINGS_POLL_INTERVAL)
+        EVENTS.emit("settings_applied", self.address, confirmed=confirmed)
+        return True
+
+    async def read_proxy_ntp_settings(self) -> Dict:
+        '''Gets the NetworkProtocol settings of this RSC'''
+        operation = "get proxy/NTP settings"
+        response = await self.do_req_handle_exceptions(
+            'GET', CHANGE_PROXY_NTP_ENDPOINT % self.address, operation)
+        return self.get_body(response, operation)
+
+    async def cancel_enrollment(self, timeout: float = DEFAULT_TIMEOUT,
+                                retry: bool = True) -> None:
+        '''Cancels the enrollment process for this RSC, like RSC.cancel_enrollment'''
+        await self.do_req_handle_exceptions(
+            'DELETE', f"https://{self.address}{self.rsc.bind_monitor}", "cancel enrollment",
+            relogin=retry, timeout=timeout, retry=retry)
+
+    async def do_req_handle_exceptions(self, method: str, url: str, operation: str, *,
+                                       json: Optional[Dict] = None, relogin: bool = True,
+                                       timeout: float = DEFAULT_TIMEOUT,
+                                       retry: bool = True) -> AsyncResponse:
+        '''Performs a request and handles exceptions, like RSC.do_req_handle_exceptions.
+        Transient failures are retried as the retry policy of the operation allows,
+        unless 'retry' is False. If the RSC rejects the session token, logs in and
+        retries once unless 'relogin' is False.'''
+        # pylint: disable=too-many-arguments
+        try:
+            response = await self.send_with_retries(method, url, operation, timeout,
+                                                    retry=retry, json=json)
+            if response.status_code == 401 and relogin:
+                logging.debug("RSC '%s' rejected the session, logging in again", self.address)
+                self.drop_session()
+                await self.login()
+                self.rsc.count_retry(operation)
+                response = await self.send_with_retries(method, url, operation, timeout,
+                                                        json=json)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as ex:
+            raise RSCException(f"Failed to connect to RSC {self.address}: {ex}") from ex
+        except aiohttp.ClientError as ex:
+            logging.debug("exception: %s", ex)
+            raise RSCException(f"Operation '{operation}' failed on RSC {self.address}") from ex
+
+        if not response.ok:
+            raise RSCException(f"Operation '{operation}' failed on RSC {self.address}: "
+                               f"{self.get_error_message(response)}", response.status_code)
+        return response
+
+    async def send_with_retries(self, method: str, url: str, operation: str, timeout: float,
+                                retry: bool = True, **kwargs) -> AsyncResponse:
+        '''Sends a request, sending it again after transient failures as the retry policy
+        of the operation allows, unless 'retry' is False. Raises RSCException without
+        sending it while the circuit breaker of the RSC is open.'''
+        # pylint: disable=too-many-arguments
+        policy = RETRY_POLICIES.get(operation, RETRY_POLICIES["*"])
+        if not retry:
+            policy = policy._replace(attempts=1)
+        attempt = 1
+        while True:
+            self.rsc.check_breaker(operation)
+            response = None
+            try:
+                response = await self.send(method, url, operation, timeout, **kwargs)
+                self.rsc.record_outcome(response.status_code < 500)
+                if attempt >= policy.attempts or not is_retryable(policy, response=response):
+                    return response
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                self.rsc.record_outcome(False)
+                if attempt >= policy.attempts or not is_retryable_error(policy, ex):
+                    raise
+            delay = get_retry_delay(policy, attempt, response)
+            logging.debug("RSC '%s' operation '%s' failed, attempt %d of %d, retrying in %.2f s",
+                          self.address, operation, attempt, policy.attempts, delay)
+            self.rsc.count_retry(operation)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def send(self, method: str, url: str, operation: str, timeout: float, *,
+                   json: Optional[Dict] = None) -> AsyncResponse:
+        '''Sends a request once the rate limits allow it, and records its duration, and
+        its error class if it fails, in the metrics of the operation. The body is read
+        and decoded once.'''
+        waited = RATE_LIMITER.reserve(self.address, operation)
+        if waited > 0:
+            logging.debug("RSC '%s' operation '%s' waited %.1f ms for the rate limit",
+                          self.address, operation, waited * 1000)
+            await asyncio.sleep(waited)
+        headers = {TOKEN_HEADER_NAME: self.token} if self.token else None
+        start = time.perf_counter()
+        error = None
+        try:
+            async with self.http.request(method, url, json=json, headers=headers,
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                result = AsyncResponse(response.status, response.headers,
+                                       decode_body(await response.read()))
+            if not result.ok:
+                error = f"HTTP {result.status_code}"
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug("send RSC '%s' code: %d response: %s",
+                              self.address, result.status_code, result.body)
+            return result
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            error = type(ex).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            METRICS.observe_request(operation, elapsed, error)
+            logging.debug("RSC '%s' operation '%s' took %.1f ms", self.address, operation,
+                          elapsed * 1000)
+
+    def get_body(self, response: AsyncResponse, operation: str) -> Dict:
+        '''Gets the decoded body of the response or raises an RSCException'''
+        if response.body is None:
+            raise RSCException(
+                f"Failed to parse response from RSC {self.address} during {operation}")
+        return response.body
+
+    @staticmethod
+    def get_error_message(response: AsyncResponse) -> Optional[str]:
+        '''Extracts the message from an error response, like get_message_from_response'''
+        if response.body is None:
+            return "can't get message from response."
+        return get_message_from_body(response.body)
@@ -2,9 +2,19 @@
 # SPDX-License-Identifier: MIT
 '''RSC class'''
 import enum
+import json
 import logging
-from typing import Dict, NoReturn, Tuple, Union
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, NamedTuple, NoReturn, Optional, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import resolve_proxies
+from rscbulkenrollment.events import EVENTS
+from rscbulkenrollment.metrics import METRICS
+from rscbulkenrollment.ratelimit import RATE_LIMITER
 
 BASE_URL = "https://%s/redfish/v1/"
 LOGIN_ENDPOINT = BASE_URL + "SessionService/Sessions"
@@ -14,6 +24,21 @@ MANAGER_ENDPOINT = BASE_URL + "Managers/1"
 BIND_TO_CLOUD_ENDPOINT = MANAGER_ENDPOINT + "/Oem/HP/Actions/HP.BindToCloud"
 TOKEN_HEADER_NAME = 'X-Auth-Token'
 CHANGE_PROXY_NTP_ENDPOINT = BASE_URL + 'Managers/1/NetworkProtocol'
+# Properties of Managers/1 used by the tool, for the Redfish $select query
+MANAGER_SELECT = "UUID,FirmwareVersion,Oem/HP/HPRemoteSystemManagerBindingStatus/BindingStatus"
+SELECT_REJECTED_STATUSES = (400, 501)
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 2
+SETTINGS_READY_TIMEOUT = 5
+SETTINGS_POLL_INTERVAL = 0.25
+RETRY_STATUSES = (429, 502, 503, 504)
+NOT_PROCESSED_STATUSES = (429, 503)
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+OPERATIONS = ("check service root", "login", "logout", "check if password needs change",
+              "change password", "get proxy/NTP settings", "set proxy/NTP settings",
+              "is enrolled to cloud", "enroll to cloud", "get enrollment status",
+              "cancel enrollment")
 
 
 class TaskState(enum.Enum):
@@ -24,30 +49,161 @@ class TaskState(enum.Enum):
     CANCELLED = 3
     UNKNOWN = 4
     ALREADY_ENROLLED = 5
+    UNREACHABLE = 6
 
 class RSCException(Exception):
-    '''Exceptions generated by RSC operations'''
+    '''Exceptions generated by RSC operations. 'status_code' is the HTTP status of the
+    response that caused it, if any.'''
+
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+class Device(NamedTuple):
+    '''Address and passwords of an RSC, as given by the user'''
+    address: str
+    old_password: str
+    new_password: str
+
+class RetryPolicy(NamedTuple):
+    '''How a failed request of an operation is sent again. Up to 'attempts' requests are
+    sent, waiting an exponential backoff with jitter from 'base_delay' up to 'max_delay'
+    seconds between them. Requests that are not 'idempotent' are only sent again when the
+    RSC did not get or did not process the first one.'''
+    attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    idempotent: bool = True
+
+# Retry policy by operation name, '*' for the operations not listed
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "*": RetryPolicy(),
+    "login": RetryPolicy(idempotent=False),
+    "change password": RetryPolicy(idempotent=False),
+    "enroll to cloud": RetryPolicy(idempotent=False),
+    "cancel enrollment": RetryPolicy(idempotent=False),
+    "logout": RetryPolicy(attempts=1),
+    "check service root": RetryPolicy(attempts=1),
+}
+
+class CircuitBreaker:
+    '''Stops sending requests to an RSC after 'threshold' consecutive failures. Once
+    'cooldown' seconds have passed, one request is let through: the breaker closes
+    again if it succeeds, and stays open for another cooldown if it fails.'''
+    __slots__ = ('threshold', 'cooldown', 'failures', 'opened_at')
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD,
+                 cooldown: float = BREAKER_COOLDOWN) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        '''Returns whether a request can be sent'''
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record(self, success: bool) -> None:
+        '''Records the outcome of a request'''
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+class Connection:
+    '''Connection handle to an RSC: the pooled requests Session, created on first use,
+    and the id of the Redfish session logged in on it.'''
+    __slots__ = ('pool_size', 'http_session', 'session_id', 'proxies')
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE) -> None:
+        self.pool_size = pool_size
+        self.http_session: Optional[requests.Session] = None
+        self.session_id = ""
+        self.proxies: Optional[Dict[str, str]] = None
+
+    @property
+    def session(self) -> requests.Session:
+        '''The requests Session used to talk to the RSC, created on first use'''
+        if self.http_session is None:
+            self.http_session = create_http_session(self.pool_size)
+        return self.http_session
+
+    def close(self) -> None:
+        '''Closes the pooled connections. Does not log out of the Redfish session.'''
+        if self.http_session:
+            self.http_session.close()
+        self.http_session = None
+        self.session_id = ""
 
 class RSC:
-    '''Remote System Controller (RSC) class.'''
-    # pylint: disable=too-many-instance-attributes
-    def __init__(self, address: str, old_password: str, new_password: str) -> None:
-        self.address = address
-        self.old_password = old_password
+    '''Remote System Controller (RSC) class.
+    Holds the device given by the user, the state of its enrollment and a connection
+    handle that is only created when the RSC is contacted. Sessions are not logged out
+    when the object is garbage collected: call close() once done with the RSC.'''
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
+    __slots__ = ('device', 'current_password', 'user_code', 'bind_monitor', 'bind_retry_after',
+                 'task_state', 'errors', 'password_change_required', 'pool_size',
+                 'connection', 'breaker', 'retries', 'uuid', 'firmware_version',
+                 'select_supported', 'service_uuid')
+
+    def __init__(self, address: str, old_password: str, new_password: str,
+                 pool_size: int = DEFAULT_POOL_SIZE) -> None:
+        self.device = Device(address, old_password, new_password)
         self.current_password = old_password
-        self.new_password = new_password
         self.user_code = ""
         self.bind_monitor = ""
-        self.monitor_state = TaskState.UNKNOWN
-        self.session_id = ""
-        self.session = None
-
-    def __del__(self):
-        if self.session_id:
-            try:
-                self.logout()
-            except (requests.HTTPError, RSCException):
-                logging.error("Failed to logout from %s", self.address)
+        self.bind_retry_after: Optional[float] = None
+        self.task_state = TaskState.UNKNOWN
+        self.errors: List[str] = []
+        self.password_change_required: Optional[bool] = None
+        self.pool_size = pool_size
+        self.connection: Optional[Connection] = None
+        # Created on the first failure, as most RSCs never need one
+        self.breaker: Optional[CircuitBreaker] = None
+        self.retries = 0
+        self.uuid = ""
+        self.firmware_version = ""
+        self.select_supported: Optional[bool] = None
+        self.service_uuid = ""
+
+    @property
+    def address(self) -> str:
+        '''Address of the RSC'''
+        return self.device.address
+
+    @property
+    def old_password(self) -> str:
+        '''Password of the RSC given by the user'''
+        return self.device.old_password
+
+    @property
+    def new_password(self) -> str:
+        '''Password to set if the RSC requires a password change'''
+        return self.device.new_password
+
+    @property
+    def monitor_state(self) -> TaskState:
+        '''State of the enrollment of the RSC. Changes are sent to the event stream.'''
+        return self.task_state
+
+    @monitor_state.setter
+    def monitor_state(self, state: TaskState) -> None:
+        if state != self.task_state:
+            self.task_state = state
+            EVENTS.emit("state", self.address, state=state.name)
+
+    def add_error(self, error: str) -> None:
+        '''Records an error of the RSC and sends it to the event stream'''
+        self.errors.append(error)
+        EVENTS.emit("error", self.address, error=error)
 
     def __str__(self) -> str:
         return f"Addr: {self.address}\n\
@@ -60,36 +216,81 @@ class RSC:
             return False
         return self.address == other.address and self.old_password == other.old_password
 
+    @property
+    def session(self) -> requests.Session:
+        '''The requests Session used to talk to the RSC, created on first use'''
+        if self.connection is None:
+            self.connection = Connection(self.pool_size)
+        return self.connection.session
+
+    @property
+    def session_id(self) -> str:
+        '''Id of the Redfish session, empty if not logged in'''
+        return self.connection.session_id if self.connection else ""
+
+    @session_id.setter
+    def session_id(self, value: str) -> None:
+        if self.connection is None:
+            self.connection = Connection(self.pool_size)
+        self.connection.session_id = value
+
+    def close(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        '''Logs out of the session, if any, and releases the connection to the RSC.
+        Raises RSCException if the logout fails; the connection is released anyway.'''
+        if self.connection is None:
+            return
+        try:
+            if self.session_id:
+                self.logout(timeout)
+        finally:
+            self.connection.close()
+            self.connection = None
+
     def login(self) -> None:
-        '''logs in to the RSC and sets its session token if successful'''
-        if self.session:
-            self.logout()
+        '''logs in to the RSC and sets its session token if successful.
+        An existing session is reused, so phases of a run share one session.'''
+        if self.session_id:
+            return
         login_response: requests.Response = None
         try:
-            login_response = requests.post(
-                url=LOGIN_ENDPOINT % self.address,
-                json={"UserName": "admin", "Password": self.current_password},
-                timeout=10,
-                verify=False)
+            login_response = self.send_with_retries(requests.Request(
+                'POST', LOGIN_ENDPOINT % self.address,
+                json={"UserName": "admin", "Password": self.current_password}),
+                "login", DEFAULT_TIMEOUT)
             login_response.raise_for_status()
 
-            self.session_id = login_response.json()['Id']
-            self.session = requests.Session()
-            self.session.headers.update(
-                {TOKEN_HEADER_NAME: login_response.headers[TOKEN_HEADER_NAME]})
-            self.session.verify = False
-            self.session.timeout = 10
+            self.session_id = json.loads(login_response.content)['Id']
+            self.session.headers[TOKEN_HEADER_NAME] = login_response.headers[TOKEN_HEADER_NAME]
+            EVENTS.emit("logged_in", self.address)
 
-        except (requests.HTTPError , requests.JSONDecodeError,
-                ConnectionRefusedError, requests.exceptions.ConnectionError) as ex:
+        except (requests.HTTPError , ValueError, TypeError,
+                ConnectionRefusedError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as ex:
             logging.debug("login failed with exception: %s", ex)
             self.raise_rsc_error(login_response, "Failed login on RSC  %s: %s")
 
-    def logout(self) -> None:
-        '''Logs out of the session'''
+    def logout(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        '''Logs out of the session. Connections to the RSC are kept open for reuse.'''
         req = requests.Request('DELETE', SESSION_ENDPOINT % (self.address, self.session_id))
-        self.do_req_handle_exceptions(req, "logout")
-        self.session = None
+        try:
+            self.do_req_handle_exceptions(req, "logout", relogin=False, timeout=timeout)
+        finally:
+            self.drop_session()
+
+    def drop_session(self) -> None:
+        '''Forgets the current session token without logging out'''
+        if self.connection:
+            self.connection.session_id = ""
+            if self.connection.http_session:
+                self.connection.http_session.headers.pop(TOKEN_HEADER_NAME, None)
+
+    def check_service_root(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        '''Checks that the Redfish service of the RSC answers, without logging in, and
+        whether it supports the $select query. The connection is kept open for the
+        requests that follow.'''
+        req = requests.Request('GET', BASE_URL % self.address)
+        body, _ = self.do_req_get_body(req, "check service root", relogin=False, timeout=timeout)
+        self.record_service_root(body)
 
     def check_needs_change_password(self) -> bool:
         '''Checks if the password needs to be changed (is still the default password) '''
@@ -101,43 +302,61 @@ class RSC:
 
         req = requests.Request('GET', ACCOUNT_ENDPOINT % self.address)
         json_body, _ = self.do_req_get_body(req, operation)
-        return json_body["PasswordChangeRequired"]
+        self.password_change_required = json_body["PasswordChangeRequired"]
+        return self.password_change_required
 
     def change_password(self) -> None:
-        '''Creates a new session and changes password for this RSC.
-        Sets the current password if successful.'''
+        '''Changes password for this RSC, logging in if needed.
+        Sets the current password if successful. The session used for the change
+        is logged out, as the RSC only allows password changes on it.'''
         self.login()
         req = requests.Request('PATCH',
             ACCOUNT_ENDPOINT % self.address,
             json={"Password": self.new_password})
         self.do_req_handle_exceptions(req, "change password")
+        self.record_password_changed()
+        try:
+            self.logout()
+        except RSCException as exp:
+            logging.debug("logout after password change failed: %s", exp)
 
-    def enroll_to_cloud(self) -> None:
+    def enroll_to_cloud(self, check_enrolled: bool = True) -> None:
         '''Invokes enroll to cloud to given RSC and records the task monitor
-        for the operation and user code'''
-        if self.is_enrolled_to_cloud():
+        for the operation and user code. Pass 'check_enrolled' as False if the caller
+        already checked that the RSC is not enrolled.'''
+        if check_enrolled and self.is_enrolled_to_cloud():
             return
         req = requests.Request('POST', BIND_TO_CLOUD_ENDPOINT % self.address)
         body, response = self.do_req_get_body(req, "enroll to cloud")
-        self.bind_monitor = response.headers["Location"]
-        self.user_code = body["User_code"]
-        self.monitor_state = TaskState.IN_PROGRESS
+        self.record_bind_started(response.headers["Location"], body["User_code"])
 
     def is_enrolled_to_cloud(self) -> bool:
         '''Checks if the RSC is already enrolled to cloud'''
+        return self.record_manager(self.read_manager())
 
+    def read_manager(self) -> Dict:
+        '''Gets the Managers/1 resource of this RSC. If the RSC supports the $select query,
+        only the properties used by the tool are asked for. The full resource is read
+        if the RSC rejects the query or leaves the binding status out, and the query is
+        not used again for this RSC.'''
         operation = "is enrolled to cloud"
-
+        if self.select_supported:
+            # Written as is rather than URL-encoded, as in the Redfish specification
+            url = f"{MANAGER_ENDPOINT % self.address}?$select={MANAGER_SELECT}"
+            req = requests.Request('GET', url)
+            try:
+                json_body, _ = self.do_req_get_body(req, operation)
+                if get_binding_status(json_body) is not None:
+                    return json_body
+            except RSCException as exp:
+                if exp.status_code not in SELECT_REJECTED_STATUSES:
+                    raise
+            logging.debug("RSC '%s' does not handle $select, reading the full resource",
+                          self.address)
+            self.select_supported = False
         req = requests.Request('GET', MANAGER_ENDPOINT % self.address)
         json_body, _ = self.do_req_get_body(req, operation)
-        status = json_body["Oem"]['HP']['HPRemoteSystemManagerBindingStatus']['BindingStatus']
-
-        is_enrolled = status == 'Enrolled'
-
-        if is_enrolled:
-            self.monitor_state = TaskState.ALREADY_ENROLLED
-
-        return is_enrolled
+        return json_body
 
     def get_bind_status(self) -> TaskState:
         '''Updates and returns the task state for the monitor of cloud enrollment for this RSC'''
@@ -153,105 +372,391 @@ class RSC:
         logging.debug("get_bind_status RSC '%s' code: %d response: %s",
                           self.address, response.status_code, json_body)
 
-        if response.status_code == 202:
-            self.monitor_state = TaskState.IN_PROGRESS
-        elif response.status_code in [200, 201]:
-            self.monitor_state = TaskState.SUCCESS
-        else:
-            self.monitor_state = TaskState.ERROR
+        return self.record_bind_status(response.status_code, response.headers.get("Retry-After"))
+
+    # The record_* methods update the state of the RSC from the answers of the RSC, for
+    # this class and for AsyncRSC alike
+
+    def record_password_changed(self) -> None:
+        '''Records that the password of the RSC was changed to the new password'''
+        self.current_password = self.new_password
+        self.password_change_required = False
+        EVENTS.emit("password_changed", self.address)
+
+    def record_bind_started(self, bind_monitor: str, user_code: str) -> None:
+        '''Records that the enrollment started, with its task monitor and user code'''
+        self.bind_monitor = bind_monitor
+        self.user_code = user_code
+        EVENTS.emit("bind_started", self.address, user_code=self.user_code)
+        self.monitor_state = TaskState.IN_PROGRESS
 
+    def record_bind_status(self, status_code: int, retry_after: Optional[str]) -> TaskState:
+        '''Records the answer of the enrollment task monitor. Returns the task state.
+        A cancelled enrollment stays cancelled, as a poll sent before the cancel may
+        answer after it.'''
+        self.bind_retry_after = parse_retry_after(retry_after)
+        if self.monitor_state != TaskState.CANCELLED:
+            self.monitor_state = get_task_state(status_code)
         return self.monitor_state
 
-    def set_proxy_ntp_settings(self, proxy_address: str, ntp_server: str) -> None:
-        '''Sets NTP and proxy settings to this RSC'''
-        ntp_settings = {
-            "NTPServers": [
-                ntp_server
-            ],
-            "ProtocolEnabled": True
-        }
-
-        proxy_settings = {
-            "Enabled": len(proxy_address) > 0,
-            "ProxyServerURI": proxy_address,
-        }
-
-        settings = {}
-        if len(proxy_address) > 0:
-            settings['Proxy'] = proxy_settings
-        if len(ntp_server) > 0:
-            settings['NTP'] = ntp_settings
-
-        if settings:
-            req = requests.Request('PATCH', CHANGE_PROXY_NTP_ENDPOINT % self.address, json=settings)
-            self.do_req_handle_exceptions(req, "set proxy/NTP settings")
+    def record_service_root(self, body: object) -> None:
+        '''Records the UUID of the Redfish service and whether it supports the $select
+        query, read from the service root'''
+        self.select_supported = select_query_supported(body)
+        service_uuid = body.get("UUID") if isinstance(body, dict) else None
+        self.service_uuid = service_uuid if isinstance(service_uuid, str) else ""
+
+    def record_manager(self, body: Dict) -> bool:
+        '''Records the UUID, firmware version and binding status read from Managers/1.
+        Returns whether the RSC is enrolled to cloud. Raises KeyError if the binding
+        status is missing.'''
+        status = body["Oem"]['HP']['HPRemoteSystemManagerBindingStatus']['BindingStatus']
+        self.uuid = body.get("UUID") or ""
+        self.firmware_version = body.get("FirmwareVersion") or ""
+
+        is_enrolled = status == 'Enrolled'
+
+        if is_enrolled:
+            self.monitor_state = TaskState.ALREADY_ENROLLED
+
+        return is_enrolled
+
+    def set_proxy_ntp_settings(self, proxy_address: str, ntp_server: str,
+                               ready_timeout: float = SETTINGS_READY_TIMEOUT,
+                               current: Optional[Dict] = None) -> bool:
+        '''Sets NTP and proxy settings to this RSC, unless it already has them.
+        The settings are read from the RSC unless the 'current' ones are given.
+        After a change, waits up to 'ready_timeout' seconds for the RSC to report the
+        new settings. Returns True if the settings were changed.'''
+        settings = get_proxy_ntp_settings(proxy_address, ntp_server)
+        if not settings:
+            return False
+        if current is None:
+            current = self.read_proxy_ntp_settings()
+        if settings_applied(current, settings):
+            return False
+        req = requests.Request('PATCH', CHANGE_PROXY_NTP_ENDPOINT % self.address, json=settings)
+        self.do_req_handle_exceptions(req, "set proxy/NTP settings")
+
+        deadline = time.monotonic() + ready_timeout
+        confirmed = True
+        while not settings_applied(self.read_proxy_ntp_settings(), settings):
+            if time.monotonic() >= deadline:
+                logging.warning("RSC '%s' does not report the new proxy/NTP settings after"
+                                " %g seconds, continuing", self.address, ready_timeout)
+                confirmed = False
+                break
+            time.sleep(SETTINGS_POLL_INTERVAL)
+        EVENTS.emit("settings_applied", self.address, confirmed=confirmed)
+        return True
+
+    def read_proxy_ntp_settings(self) -> Dict:
+        '''Gets the NetworkProtocol settings of this RSC'''
+        req = requests.Request('GET', CHANGE_PROXY_NTP_ENDPOINT % self.address)
+        body, _ = self.do_req_get_body(req, "get proxy/NTP settings")
+        return body
 
     def raise_rsc_error(self, response: requests.Response, error_fmt: str) -> NoReturn:
         '''Takes in a response and a format error message and raises an RSCException.
         error_fmt has to have placeholders for two strings: the RSC address and the error
         message for the response'''
         error = get_message_from_response(response)
-        raise RSCException(error_fmt % (self.address, error))
+        raise RSCException(error_fmt % (self.address, error),
+                           response.status_code if response is not None else None)
 
-    def cancel_enrollment(self) -> None:
-        '''Cancels the enrollment process for this RSC'''
+    def cancel_enrollment(self, timeout: float = DEFAULT_TIMEOUT, retry: bool = True) -> None:
+        '''Cancels the enrollment process for this RSC. Without 'retry', the request is
+        sent only once, and not again with a new session if the RSC rejects the current
+        one, for when the user is waiting for the cancel.'''
         req = requests.Request('DELETE', f"https://{self.address}{self.bind_monitor}")
-        self.do_req_handle_exceptions(req, "cancel enrollment")
-
-    def do_req_handle_exceptions(self, req: requests.Request, operation: str) -> requests.Response:
-        '''Performs a request and handles exceptions'''
+        self.do_req_handle_exceptions(req, "cancel enrollment", relogin=retry, timeout=timeout,
+                                      retry=retry)
+
+    def do_req_handle_exceptions(self, req: requests.Request, operation: str,
+                                 relogin: bool = True,
+                                 timeout: float = DEFAULT_TIMEOUT, *,
+                                 retry: bool = True) -> requests.Response:
+        '''Performs a request and handles exceptions. Transient failures are retried as
+        the retry policy of the operation allows, unless 'retry' is False. If the RSC
+        rejects the session token (e.g. it expired or there was no session yet), logs
+        in and retries once unless 'relogin' is False.'''
+        # pylint: disable=too-many-arguments
         try:
-            response = self.session.send(self.session.prepare_request(req))
-            logging.debug("do_req_handle_exceptions RSC '%s' code: %d ok: %s response: %s",
-                          self.address, response.status_code, response.ok, response.text)
+            response = self.send_with_retries(req, operation, timeout, retry=retry)
+            if response.status_code == 401 and relogin:
+                logging.debug("RSC '%s' rejected the session, logging in again", self.address)
+                self.drop_session()
+                self.login()
+                self.count_retry(operation)
+                response = self.send_with_retries(req, operation, timeout)
+            if logging.root.isEnabledFor(logging.DEBUG):
+                # Decoding the body as text is costly, only done if it is logged
+                logging.debug("do_req_handle_exceptions RSC '%s' code: %d ok: %s response: %s",
+                              self.address, response.status_code, response.ok, response.text)
             if response is not None and not response.ok:
                 logging.debug("response was not ok")
                 self.raise_rsc_error(response, f"Operation '{operation}' failed on RSC %s: %s")
             return response
         except requests.exceptions.ConnectionError as ex:
             raise RSCException(f"Failed to connect to RSC {self.address}: {ex}") from ex
+        except requests.exceptions.Timeout as ex:
+            raise RSCException(f"RSC {self.address} did not answer in time: {ex}") from ex
         except ConnectionRefusedError as ex:
             raise RSCException(f"Connection refused by RSC {self.address}: {ex}") from ex
         except requests.HTTPError as ex:
             logging.debug("exception: %s", ex)
             raise RSCException(f"Operation '{operation}' failed on RSC {self.address}") from ex
+        except requests.RequestException as ex:
+            # e.g. an invalid address, which must not stop the other RSCs
+            raise RSCException(
+                f"Operation '{operation}' failed on RSC '{self.address}': {ex}") from ex
+
+    def send_with_retries(self, req: requests.Request, operation: str,
+                          timeout: float, retry: bool = True) -> requests.Response:
+        '''Sends a request, sending it again after transient failures as the retry policy
+        of the operation allows, unless 'retry' is False. Raises RSCException without
+        sending it while the circuit breaker of the RSC is open.'''
+        policy = RETRY_POLICIES.get(operation, RETRY_POLICIES["*"])
+        if not retry:
+            policy = policy._replace(attempts=1)
+        attempt = 1
+        while True:
+            self.check_breaker(operation)
+            response = None
+            try:
+                response = self.send(req, operation, timeout)
+                self.record_outcome(response.status_code < 500)
+                if attempt >= policy.attempts or not is_retryable(policy, response=response):
+                    return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+                self.record_outcome(False)
+                if attempt >= policy.attempts or not is_retryable(policy, exception=ex):
+                    raise
+            delay = get_retry_delay(policy, attempt, response)
+            logging.debug("RSC '%s' operation '%s' failed, attempt %d of %d, retrying in %.2f s",
+                          self.address, operation, attempt, policy.attempts, delay)
+            self.count_retry(operation)
+            time.sleep(delay)
+            attempt += 1
+
+    def check_breaker(self, operation: str) -> None:
+        '''Raises RSCException while the circuit breaker of the RSC is open'''
+        if self.breaker is not None and not self.breaker.allow():
+            raise RSCException(f"RSC {self.address} keeps failing, operation '{operation}'"
+                               f" not attempted for {self.breaker.cooldown:g} seconds")
+
+    def record_outcome(self, success: bool) -> None:
+        '''Records the outcome of a request in the circuit breaker of the RSC, creating it
+        on the first failure'''
+        if self.breaker is None:
+            if success:
+                return
+            self.breaker = CircuitBreaker()
+        self.breaker.record(success)
+
+    def count_retry(self, operation: str) -> None:
+        '''Counts a request sent again, for the RSC and in the metrics of the operation'''
+        self.retries += 1
+        METRICS.count_retry(operation)
+
+    def send(self, req: requests.Request, operation: str, timeout: float) -> requests.Response:
+        '''Sends a request on the session once the rate limits allow it, and records its
+        duration, and its error class if it fails, in the metrics of the operation'''
+        waited = RATE_LIMITER.acquire(self.address, operation)
+        if waited:
+            logging.debug("RSC '%s' operation '%s' waited %.1f ms for the rate limit",
+                          self.address, operation, waited * 1000)
+        start = time.perf_counter()
+        error = None
+        try:
+            session = self.session
+            prepared = session.prepare_request(req)
+            if self.connection.proxies is None:
+                # Proxies from the environment only depend on the address: resolved once
+                self.connection.proxies = resolve_proxies(prepared, session.proxies, True)
+            response = session.send(prepared, timeout=timeout, proxies=self.connection.proxies)
+            if not response.ok:
+                error = f"HTTP {response.status_code}"
+            return response
+        except (requests.RequestException, ConnectionRefusedError) as ex:
+            error = type(ex).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            METRICS.observe_request(operation, elapsed, error)
+            logging.debug("RSC '%s' operation '%s' took %.1f ms", self.address, operation,
+                          elapsed * 1000)
 
     def get_body(self, response: requests.Response, operation: str) -> Dict:
         '''Gets the body of the response and handles exceptions'''
         try:
-            return response.json()
-        except requests.JSONDecodeError as ex:
+            return json.loads(response.content)
+        except ValueError as ex:
             raise RSCException(
                 f"Failed to parse response from RSC {self.address} during {operation}") from ex
 
-    def do_req_get_body(self, req: requests.Request,
-                        operation: str) -> Tuple[Dict, requests.Response]:
-        '''Performs a request and returns the body of the response and the response'''
-        response = self.do_req_handle_exceptions(req, operation)
+    def do_req_get_body(self, req: requests.Request, operation: str,
+                        **kwargs) -> Tuple[Dict, requests.Response]:
+        '''Performs a request and returns the body of the response and the response.
+        Keyword arguments are passed on to do_req_handle_exceptions.'''
+        response = self.do_req_handle_exceptions(req, operation, **kwargs)
         return self.get_body(response, operation), response
 
+def create_http_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    '''Creates the requests Session of an RSC. It keeps up to 'pool_size' connections
+    to the RSC alive, so TLS handshakes are not repeated on every request.'''
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size)))
+    session.verify = False
+    # Environment settings are not looked up on every request: the RSC class resolves
+    # the proxies once per connection, and Redfish sessions don't use .netrc credentials
+    session.trust_env = False
+    return session
+
+def get_task_state(status_code: int) -> TaskState:
+    '''Maps the status code of a task monitor response to a task state'''
+    if status_code == 202:
+        return TaskState.IN_PROGRESS
+    if status_code in [200, 201]:
+        return TaskState.SUCCESS
+    return TaskState.ERROR
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    '''Parses a Retry-After header value (delay in seconds or HTTP date).
+    Returns the number of seconds to wait, or None if the value is missing or invalid.'''
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def is_retryable(policy: RetryPolicy, response: Optional[requests.Response] = None,
+                 exception: Optional[Exception] = None) -> bool:
+    '''Returns whether a request that got 'response' or raised 'exception' can be sent again.
+    Failures to connect and answers saying the request was not processed can always be
+    retried, other transient failures only for idempotent operations.'''
+    if exception is not None:
+        return (isinstance(exception, requests.exceptions.ConnectTimeout)
+                or policy.idempotent)
+    if response.status_code in NOT_PROCESSED_STATUSES:
+        return True
+    return policy.idempotent and response.status_code in RETRY_STATUSES
+
+def get_retry_delay(policy: RetryPolicy, attempt: int,
+                    response: Optional[requests.Response] = None) -> float:
+    '''Returns the seconds to wait before sending a request again after 'attempt' failed
+    ones: the Retry-After of the response if any, else an exponential backoff with full
+    jitter. Never longer than the maximum delay of the policy.'''
+    retry_after = (parse_retry_after(response.headers.get("Retry-After"))
+                   if response is not None else None)
+    if retry_after is not None:
+        return min(retry_after, policy.max_delay)
+    return random.uniform(0, min(policy.base_delay * 2 ** (attempt - 1), policy.max_delay))
+
+def configure_retries(retries: int) -> None:
+    '''Sets how many times a failed request is sent again, for all the operations that
+    are retried. Meant to be called once, before any request is sent.'''
+    for operation, policy in RETRY_POLICIES.items():
+        if policy.attempts > 1:
+            RETRY_POLICIES[operation] = policy._replace(attempts=retries + 1)
+
+def get_proxy_ntp_settings(proxy_address: str, ntp_server: str) -> Dict:
+    '''Builds the NetworkProtocol settings body for the given proxy and NTP server.
+    Empty values are left out.'''
+    ntp_settings = {
+        "NTPServers": [
+            ntp_server
+        ],
+        "ProtocolEnabled": True
+    }
+
+    proxy_settings = {
+        "Enabled": len(proxy_address) > 0,
+        "ProxyServerURI": proxy_address,
+    }
+
+    settings = {}
+    if len(proxy_address) > 0:
+        settings['Proxy'] = proxy_settings
+    if len(ntp_server) > 0:
+        settings['NTP'] = ntp_settings
+    return settings
+
+def settings_applied(current: Dict, desired: Dict) -> bool:
+    '''Checks if the 'current' settings of an RSC include the 'desired' ones. Lists only
+    have to contain the desired items.'''
+    for key, value in desired.items():
+        current_value = current.get(key) if isinstance(current, dict) else None
+        if isinstance(value, dict):
+            if not isinstance(current_value, dict) or not settings_applied(current_value, value):
+                return False
+        elif isinstance(value, list):
+            if not isinstance(current_value, list) or any(v not in current_value for v in value):
+                return False
+        elif current_value != value:
+            return False
+    return True
+
+def decode_body(content: bytes) -> Optional[Any]:
+    '''Decodes a JSON body. Returns None if it is empty or not JSON.'''
+    if not content:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+def select_query_supported(service_root: object) -> bool:
+    '''Checks if the service root of an RSC advertises the $select query'''
+    features = (service_root.get("ProtocolFeaturesSupported")
+                if isinstance(service_root, dict) else None)
+    return isinstance(features, dict) and features.get("SelectQuery") is True
+
+def get_binding_status(body: object) -> Optional[str]:
+    '''Extracts the cloud binding status from the body of Managers/1, None if missing'''
+    try:
+        return body["Oem"]["HP"]["HPRemoteSystemManagerBindingStatus"]["BindingStatus"]
+    except (KeyError, TypeError):
+        return None
+
 def get_message_from_response(response: requests.Response) -> Union[str, None]:
     '''Extracts the message from a response error'''
     if response is None:
         return None
     logging.debug("Reponse code: %d", response.status_code)
     if response.status_code < 200 or response.status_code >= 300:
-        try:
-            error: dict = response.json().get('error')
-            if error is None:
-                return None
-            extended_message_info = error.get('@Message.ExtendedInfo')
-            if extended_message_info:
-                message_info = extended_message_info[0]['Message']
-                if ('Oem' in extended_message_info[0] and
-                        'HP' in extended_message_info[0]['Oem'] and
-                        'ErrorDetails' in extended_message_info[0]['Oem']['HP']):
-                    details = extended_message_info[0]['Oem']['HP'].get('ErrorDetails')
-                    if len(details) > 0:
-                        message_info += ("\nDetails: '" + details + "'")
-                return message_info
-        except requests.JSONDecodeError:
+        body = decode_body(response.content)
+        if body is None:
             logging.debug("can't get message from response.")
             return "can't get message from response."
+        return get_message_from_body(body)
 
     return None
+
+def get_message_from_body(body: object) -> Union[str, None]:
+    '''Extracts the message from the decoded JSON body of a Redfish error'''
+    if not isinstance(body, dict):
+        return None
+    error = body.get('error')
+    if error is None:
+        return None
+    extended_message_info = error.get('@Message.ExtendedInfo')
+    if extended_message_info:
+        message_info = extended_message_info[0]['Message']
+        if ('Oem' in extended_message_info[0] and
+                'HP' in extended_message_info[0]['Oem'] and
+                'ErrorDetails' in extended_message_info[0]['Oem']['HP']):
+            details = extended_message_info[0]['Oem']['HP'].get('ErrorDetails')
+            if len(details) > 0:
+                message_info += ("\nDetails: '" + details + "'")
+        return message_info
+    return None
@@ -5,11 +5,13 @@
 import logging
 import argparse
 import sys
+from typing import List, Optional, Tuple
 import urllib3
 
 from rscbulkenrollment.rsc import rsc as rscpkg
 from rscbulkenrollment.discovery import rsc_finder, importer
-from rscbulkenrollment import cloudenrollment, password
+from rscbulkenrollment import (cloudenrollment, events, journal, metrics, password, preflight,
+                               ratelimit, sessions, shard, statecache)
 
 urllib3.disable_warnings(
     urllib3.exceptions.InsecureRequestWarning)  # type: ignore
@@ -36,6 +38,17 @@ by default is "rsc-" with the serial number of the RSC, which can be scanned on
 the RSC QR code label. 
 For example, the hostname for serial number 8DD123FFF would be, rsc-8DD123FFF.
 
+Credentials Format
+------------------
+Given creds.csv as a file for --enroll-discovered with the following contents:
+
+192.168.240.0/24,CurrentPassword1,Newpassword1
+*,CurrentPassword2
+
+Discovered RSCs in 192.168.240.0/24 use the passwords in the first line. All
+other discovered RSCs use the passwords in the second line. When several
+subnets contain an RSC, the most specific one is used.
+
 Examples
 --------
 - Pass in a CSV of RSCs to enroll to cloud:
@@ -46,6 +59,17 @@ Examples
     python3 rsc_bulk_enroll -c RSC.csv -p
 - Pass in a CSV of RSCs to enroll to cloud, informing proxy and NTP settings:
     python3 rsc_bulk_enroll -c RSC.csv --ntp myNTPserver.com --proxy http://myproxy.com:8080
+- Discover RSCs and enroll them as they are found, with the passwords in creds.csv:
+    python3 rsc_bulk_enroll --enroll-discovered creds.csv
+- Enroll the RSCs of a CSV that are not enrolled yet, and fix their NTP settings:
+    python3 rsc_bulk_enroll -c RSC.csv --reconcile --ntp myNTPserver.com
+- Split the RSCs of a CSV across two hosts and merge their results:
+    python3 rsc_bulk_enroll -c RSC.csv --shard 1/2 --results shard1.jsonl   (on host 1)
+    python3 rsc_bulk_enroll -c RSC.csv --shard 2/2 --results shard2.jsonl   (on host 2)
+    python3 rsc_bulk_enroll --merge shard1.jsonl shard2.jsonl
+- Enroll a CSV of RSCs keeping a journal, then resume the run if it is interrupted:
+    python3 rsc_bulk_enroll -c RSC.csv --journal run.jsonl
+    python3 rsc_bulk_enroll -c RSC.csv --journal run.jsonl --resume
 '''
 
 def main():
@@ -53,9 +77,21 @@ def main():
     args = parse_args()
 
     set_verbosity(args.verbose)
+    rscpkg.configure_retries(args.retries)
+    ratelimit.RATE_LIMITER.configure(args.rate, args.subnet_rate, args.subnet_prefix,
+                                     dict(args.operation_rate))
+
+    with events.EVENTS.output(args.events):
+        run_command(args)
+
+def run_command(args: argparse.Namespace) -> None:
+    '''Runs the command given in the arguments'''
+    if args.merge:
+        merge_results(args.merge)
+        return
 
     if args.d:
-        rscs = rsc_finder.discover_rscs()
+        rscs = rsc_finder.discover_rscs(args.discovery_time)
         if len(rscs) == 0:
             print("No RSCs discovered. Is your firewall blocking UDP port 5353?")
             sys.exit(1)
@@ -65,37 +101,202 @@ def main():
             print(rsc.address)
         sys.exit(0)
 
+    if args.enroll_discovered:
+        rscs = []
+        with metrics_exporter(args), sessions.SessionManager(rscs):
+            discover_and_enroll(args, rscs)
+        return
+
     if not args.i and not args.c:
         print("ERROR: Need either -c or -i to continue")
         sys.exit(1)
 
     try:
-        rscs = importer.import_rscs(filename=args.c, rsc_list=args.i)
+        rscs = importer.import_rscs(filename=args.c, rsc_list=args.i,
+                                    pool_size=args.pool_size)
     except ValueError as exp:
         print(exp)
         sys.exit(1)
+    if args.shard:
+        rscs = shard.select_shard(rscs, args.shard, args.shard_by, args.subnet_prefix)
+        print(f"Shard {args.shard[0]}/{args.shard[1]} has {len(rscs)} RSC(s)")
+
+    with metrics_exporter(args), sessions.SessionManager(rscs):
+        run(args, rscs)
 
-    if not password.validate_rsc_passwords(rscs):
+def merge_results(filenames: List[str]) -> None:
+    '''Prints the final state of all RSCs in the results files of several shards'''
+    try:
+        rscs = shard.load_results(filenames)
+    except OSError as exp:
+        print(exp)
         sys.exit(1)
+    print("Final state is:")
+    for rsc in rscs:
+        print_rsc_final_state(rsc)
 
-    if args.p:
-        sys.exit(0)
+def metrics_exporter(args: argparse.Namespace) -> metrics.MetricsExporter:
+    '''Exporter of the run metrics to the files given in the arguments'''
+    return metrics.MetricsExporter(args.metrics, args.metrics_prometheus)
 
-    if args.change_password:
-        exit_code = 0 if password.change_rsc_passwords(rscs) else 1
-        sys.exit(exit_code)
+def run(args: argparse.Namespace, rscs: List[rscpkg.RSC]) -> None:
+    '''Validates, changes passwords or enrolls the imported RSCs, as requested'''
+    if args.p or args.change_password:
+        reachable = check_reachable(args, rscs)
+        if (len(reachable) != len(rscs)
+                or not password.validate_rsc_passwords(reachable, args.workers)):
+            sys.exit(1)
+
+        if args.p:
+            sys.exit(0)
+
+        outcomes = password.change_rsc_passwords(rscs, args.workers)
+        if args.results:
+            try:
+                password.write_password_outcomes(args.results, outcomes)
+            except OSError as exp:
+                logging.error("Failed to write results: %s", exp)
+        changed = len([outcome for outcome in outcomes if outcome.verified])
+        print(f"Changed and verified the password of {changed} of {len(outcomes)} RSCs")
+        sys.exit(0 if changed == len(outcomes) else 1)
+
+    resumed = []
+    if args.resume:
+        resumed = journal.resume_rscs(rscs, journal.load_journal(args.journal))
+        print(f"Resuming run from journal '{args.journal}'")
+    pending = [rsc for rsc in rscs if rsc.monitor_state == rscpkg.TaskState.UNKNOWN]
+    check_reachable(args, resumed + pending)
+    resumed = [rsc for rsc in resumed if rsc.monitor_state != rscpkg.TaskState.UNREACHABLE]
+    pending = [rsc for rsc in pending if rsc.monitor_state != rscpkg.TaskState.UNREACHABLE]
+    cache = open_state_cache(args)
+    cached = skip_cached(args, cache, pending)
+    pending = [rsc for rsc in pending if rsc.monitor_state == rscpkg.TaskState.UNKNOWN]
+
+    if args.validate_first and not password.validate_rsc_passwords(pending, args.workers):
+        sys.exit(1)
+
+    run_journal = journal.Journal(args.journal) if args.journal else None
+    try:
+        rscs_to_monitor = resumed + cloudenrollment.bind_rscs_to_cloud(
+            pending, args.proxy, args.ntp, args.workers, journal=run_journal,
+            reconcile=args.reconcile)
+        monitor_and_report(args, rscs, rscs_to_monitor, run_journal)
+    finally:
+        if run_journal:
+            run_journal.close()
+        save_state_cache(args, cache, rscs, cached)
+
+def open_state_cache(args: argparse.Namespace) -> Optional[statecache.StateCache]:
+    '''Opens the state cache given in the arguments, if any'''
+    if not args.state_cache:
+        return None
+    return statecache.StateCache(args.state_cache, args.cache_ttl)
+
+def skip_cached(args: argparse.Namespace, cache: Optional[statecache.StateCache],
+                rscs: List[rscpkg.RSC]) -> List[rscpkg.RSC]:
+    '''Marks the RSCs recently confirmed enrolled in the state cache as ALREADY_ENROLLED,
+    unless --refresh was given, and returns them. The service roots not read by the
+    pre-flight check are read first, to tell the cached RSCs from replaced ones.'''
+    if cache is None:
+        return []
+    statecache.read_service_uuids(rscs, args.preflight_timeout)
+    if args.refresh:
+        return []
+    cached = cache.apply(rscs, args.proxy, args.ntp)
+    if cached:
+        print(f"Skipping {len(cached)} RSC(s) confirmed enrolled in the last"
+              f" {args.cache_ttl} seconds, use --refresh to check them again")
+    return cached
+
+def save_state_cache(args: argparse.Namespace, cache: Optional[statecache.StateCache],
+                     rscs: List[rscpkg.RSC], cached: List[rscpkg.RSC]) -> None:
+    '''Records the final state of the RSCs in the state cache, if any'''
+    if cache is None:
+        return
+    cache.update(rscs, args.proxy, args.ntp, skipped=cached)
+    try:
+        cache.save()
+    except OSError as exp:
+        logging.error("Failed to write state cache: %s", exp)
 
-    rscs_to_monitor = cloudenrollment.bind_rscs_to_cloud(rscs, args.proxy, args.ntp)
+def check_reachable(args: argparse.Namespace, rscs: List[rscpkg.RSC]) -> List[rscpkg.RSC]:
+    '''Runs the pre-flight reachability check, unless disabled, and returns the
+    reachable RSCs'''
+    if args.no_preflight:
+        return rscs
+    reachable = preflight.check_rscs_reachable(rscs, timeout=args.preflight_timeout)
+    preflight.print_unreachable(rscs)
+    return reachable
 
+def discover_and_enroll(args: argparse.Namespace, rscs: List[rscpkg.RSC]) -> None:
+    '''Starts enrolling each RSC as soon as it is discovered, with the passwords
+    of its subnet in the credential file. Discovered RSCs are added to 'rscs'.'''
+    try:
+        credentials = importer.import_credentials(args.enroll_discovered)
+    except (OSError, ValueError) as exp:
+        print(exp)
+        sys.exit(1)
+
+    def enroll_found(found: rscpkg.RSC) -> None:
+        if args.shard and not shard.select_shard([found], args.shard, args.shard_by,
+                                                 args.subnet_prefix):
+            logging.info("Discovered RSC '%s' is in another shard, skipping it", found.address)
+            return
+        credential = importer.find_credential(found.address, credentials)
+        if credential is None:
+            print(f"No credentials for discovered RSC '{found.address}', skipping it")
+            return
+        rsc = rscpkg.RSC(found.address, credential.current_password, credential.new_password,
+                         args.pool_size)
+        rscs.append(rsc)
+        binder.submit(rsc)
+
+    def skip_found(found: rscpkg.RSC) -> bool:
+        # Called by the binder workers, as it reads the service root of the RSC
+        if skip_cached(args, cache, [found]):
+            cached.append(found)
+            return True
+        return False
+
+    cache = open_state_cache(args)
+    cached: List[rscpkg.RSC] = []
+    run_journal = journal.Journal(args.journal) if args.journal else None
+    try:
+        with cloudenrollment.CloudBinder(args.proxy, args.ntp, args.workers,
+                                         journal=run_journal, reconcile=args.reconcile,
+                                         skip=skip_found if cache else None) as binder:
+            rsc_finder.discover_rscs(args.discovery_time, on_found=enroll_found)
+        if len(rscs) == 0:
+            print("No RSCs discovered. Is your firewall blocking UDP port 5353?")
+            sys.exit(1)
+        monitor_and_report(args, rscs, binder.started(), run_journal)
+    finally:
+        if run_journal:
+            run_journal.close()
+        save_state_cache(args, cache, rscs, cached)
+
+def monitor_and_report(args: argparse.Namespace, rscs: List[rscpkg.RSC],
+                       rscs_to_monitor: List[rscpkg.RSC],
+                       run_journal: Optional[journal.Journal]) -> None:
+    '''Prints the verification URI, monitors the enrollments and prints the final
+    state of all RSCs'''
     if len(rscs_to_monitor) > 0:
-        cloudenrollment.print_verification_uri(rscs_to_monitor)
-        if len([rsc for rsc in rscs_to_monitor if len(rsc.user_code) > 0 ]) > 0:
+        batches = cloudenrollment.print_verification_uri(rscs_to_monitor, args.batch_size,
+                                                         args.batch_dir)
+        if len(batches) > 0:
             print("**** Monitoring RSCs, enter CTRL+C to abort monitoring ****")
-            cloudenrollment.monitor_rscs(rscs_to_monitor)
+            progress = cloudenrollment.BatchProgress(batches) if len(batches) > 1 else None
+            cloudenrollment.monitor_rscs(rscs_to_monitor, args.workers, run_journal,
+                                         progress.complete if progress else None)
 
     print("Final state is:")
     for rsc in rscs:
         print_rsc_final_state(rsc)
+    if args.results:
+        try:
+            shard.write_results(args.results, rscs)
+        except OSError as exp:
+            logging.error("Failed to write results: %s", exp)
 
 def parse_args() -> argparse.Namespace:
     '''parses arguments'''
@@ -117,19 +318,169 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument('-d', action='store_true',
                         help=("Discover RSCs in the network and exit."
                               " Requires mDNS port (UDP 5353) to be open."))
+    parser.add_argument('--enroll-discovered', metavar="CredentialsFilePath",
+                        dest="enroll_discovered",
+                        help=("Discover RSCs in the network and enroll each one as soon as it is"
+                              " found, with the passwords for its subnet in this CSV file."))
+    parser.add_argument('--discovery-time', type=positive_int,
+                        default=rsc_finder.DISCOVERY_MAX_TIME, metavar="SECONDS",
+                        dest="discovery_time",
+                        help=("Maximum time to spend discovering RSCs. Discovery ends"
+                              " earlier once RSCs answered and no new ones show up."
+                              f" Default is {rsc_finder.DISCOVERY_MAX_TIME}."))
     parser.add_argument('--proxy', help="Set this proxy for cloud access.")
     parser.add_argument('--ntp', help="Set this NTP server to correct RSC's times.")
     parser.add_argument('--change-password',
                         help="Only change passwords for the specified RSCs and exit.",
                         action='store_true', dest="change_password")
+    parser.add_argument('--validate-first',
+                        help=("Validate the passwords of all RSCs before enrolling any,"
+                              " and exit if any of them fails."),
+                        action='store_true', dest="validate_first")
+    parser.add_argument('--reconcile', action='store_true',
+                        help=("Read the state of each RSC first and only send the requests"
+                              " needed to enroll it with the given proxy/NTP settings."
+                              " Faster when most RSCs are already enrolled."))
+    parser.add_argument('--no-preflight', action='store_true', dest="no_preflight",
+                        help="Skip the reachability check of all RSCs done before logging in.")
+    parser.add_argument('--preflight-timeout', type=positive_int,
+                        default=preflight.PREFLIGHT_TIMEOUT, metavar="SECONDS",
+                        dest="preflight_timeout",
+                        help=("Time an RSC has to answer the reachability check."
+                              f" Default is {preflight.PREFLIGHT_TIMEOUT}."))
+    parser.add_argument('--journal', metavar="FILE",
+                        help="Record the progress of each RSC in this file, to allow --resume.")
+    parser.add_argument('--resume', action='store_true',
+                        help=("Resume the run recorded in the --journal file: skip enrolled RSCs"
+                              " and keep monitoring enrollments in progress."))
+    parser.add_argument('--batch-size', type=positive_int, metavar="N",
+                        default=cloudenrollment.DEFAULT_BATCH_SIZE, dest="batch_size",
+                        help=("Maximum user codes per verification URI. Default is"
+                              f" {cloudenrollment.DEFAULT_BATCH_SIZE}."))
+    parser.add_argument('--batch-dir', metavar="DIR", dest="batch_dir",
+                        help=("Write each batch of user codes to this directory, as text, HTML"
+                              " and CSV files listing its RSCs."))
+    parser.add_argument('--state-cache', metavar="FILE", dest="state_cache",
+                        help=("Remember the RSCs found enrolled in this file, and skip them in"
+                              " the next runs while the cache is fresh."))
+    parser.add_argument('--cache-ttl', type=positive_int, metavar="SECONDS",
+                        default=statecache.DEFAULT_CACHE_TTL, dest="cache_ttl",
+                        help=("Time an RSC stays skipped after it was found enrolled."
+                              f" Default is {statecache.DEFAULT_CACHE_TTL}."))
+    parser.add_argument('--refresh', action='store_true',
+                        help=("Check all RSCs again, ignoring the --state-cache file,"
+                              " and update it."))
+    parser.add_argument('--events', metavar="FILE",
+                        help=("Append an NDJSON event to this file each time an RSC logs in,"
+                              " changes password or settings, starts enrolling, changes state"
+                              " or fails. Use '-' for stdout; other output then goes to stderr."))
+    parser.add_argument('--metrics', metavar="FILE",
+                        help=("Write request latencies, errors, retries and phase durations"
+                              " per RSC to this JSON file at the end of the run."))
+    parser.add_argument('--metrics-prometheus', metavar="FILE", dest="metrics_prometheus",
+                        help=("Write the metrics in Prometheus text format to this file,"
+                              f" refreshed every {metrics.PROMETHEUS_INTERVAL} seconds."))
+    parser.add_argument('--retries', type=non_negative_int,
+                        default=rscpkg.RETRY_POLICIES["*"].attempts - 1, metavar="N",
+                        help=("Times a request failing with a transient error is sent again."
+                              f" Default is {rscpkg.RETRY_POLICIES['*'].attempts - 1}."))
+    parser.add_argument('--pool-size', type=positive_int, default=rscpkg.DEFAULT_POOL_SIZE,
+                        metavar="N", dest="pool_size",
+                        help=("Connections kept open to each RSC, reused by all its requests."
+                              f" Default is {rscpkg.DEFAULT_POOL_SIZE}."))
+    parser.add_argument('--rate', type=positive_float, metavar="N",
+                        help="Maximum requests per second sent to all RSCs. Unlimited by default.")
+    parser.add_argument('--subnet-rate', type=positive_float, metavar="N", dest="subnet_rate",
+                        help=("Maximum requests per second sent to the RSCs of each subnet."
+                              " Unlimited by default."))
+    parser.add_argument('--subnet-prefix', type=positive_int, metavar="BITS",
+                        default=ratelimit.DEFAULT_SUBNET_PREFIX, dest="subnet_prefix",
+                        help=("Prefix length of the IPv4 subnets for --subnet-rate and"
+                              " --shard-by subnet."
+                              f" Default is {ratelimit.DEFAULT_SUBNET_PREFIX}."))
+    parser.add_argument('--operation-rate', type=operation_rate, action='append', default=[],
+                        metavar="OPERATION=N", dest="operation_rate",
+                        help=("Maximum requests per second of an operation, e.g."
+                              " 'enroll to cloud=2'. Can be given for several operations."))
+    parser.add_argument('--shard', type=shard_type, metavar="i/N",
+                        help=("Only process the i-th of N shards of the RSCs, to split a run"
+                              " across several hosts."))
+    parser.add_argument('--shard-by', choices=shard.SHARD_KEYS, default="address",
+                        dest="shard_by",
+                        help=("Split RSCs in shards by a hash of their address, or of their"
+                              " subnet to keep each subnet on one host. Default is address."))
+    parser.add_argument('--results', metavar="FILE",
+                        help=("Write the final state of each RSC to this file, for --merge."
+                              " With --change-password, write the outcome of each password"
+                              " change instead."))
+    parser.add_argument('--merge', metavar="FILE", nargs='+',
+                        help=("Print the final state of all RSCs in these --results files"
+                              " of several shards and exit."))
+    parser.add_argument('--workers', type=positive_int, default=cloudenrollment.DEFAULT_WORKERS,
+                        metavar="N",
+                        help=("Number of RSCs to enroll, monitor or change the password of"
+                              " at the same time."
+                              f" Default is {cloudenrollment.DEFAULT_WORKERS}."))
 
     args = parser.parse_args()
     if args.examples:
         parser.print_help()
         print(EXAMPLES)
         sys.exit(0)
+    if args.resume and not args.journal:
+        parser.error("--resume requires --journal")
+    if args.subnet_prefix > 32:
+        parser.error("--subnet-prefix can not be greater than 32")
     return args
 
+def positive_int(value: str) -> int:
+    '''argparse type for integers greater than zero'''
+    try:
+        number = int(value)
+    except ValueError as exp:
+        raise argparse.ArgumentTypeError(f"'{value}' is not an integer") from exp
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"'{value}' has to be greater than zero")
+    return number
+
+def positive_float(value: str) -> float:
+    '''argparse type for numbers greater than zero'''
+    try:
+        number = float(value)
+    except ValueError as exp:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a number") from exp
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"'{value}' has to be greater than zero")
+    return number
+
+def operation_rate(value: str) -> Tuple[str, float]:
+    '''argparse type for an operation name and its maximum requests per second'''
+    operation, separator, rate = value.rpartition("=")
+    if not separator or not operation.strip():
+        raise argparse.ArgumentTypeError(f"'{value}' is not in the OPERATION=N format")
+    if operation.strip() not in rscpkg.OPERATIONS:
+        raise argparse.ArgumentTypeError(
+            f"'{operation.strip()}' is not an operation, use one of: "
+            + ", ".join(f"'{name}'" for name in rscpkg.OPERATIONS))
+    return operation.strip(), positive_float(rate)
+
+def shard_type(value: str) -> Tuple[int, int]:
+    '''argparse type for a shard given as i/N'''
+    try:
+        return shard.parse_shard(value)
+    except ValueError as exp:
+        raise argparse.ArgumentTypeError(str(exp)) from exp
+
+def non_negative_int(value: str) -> int:
+    '''argparse type for integers greater than or equal to zero'''
+    try:
+        number = int(value)
+    except ValueError as exp:
+        raise argparse.ArgumentTypeError(f"'{value}' is not an integer") from exp
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"'{value}' can not be negative")
+    return number
+
 def set_verbosity(verbose_level: int) -> None:
     '''Set verbosity level of the root logger'''
     if verbose_level == 1:
@@ -149,5 +500,11 @@ def print_rsc_final_state(rsc: rscpkg.RSC) -> None:
         print("\t", rsc.address, ":", "enroll to cloud ERROR")
     elif rsc.monitor_state == rscpkg.TaskState.ALREADY_ENROLLED:
         print("\t", rsc.address, ":", "ALREADY ENROLLED")
+    elif rsc.monitor_state == rscpkg.TaskState.UNREACHABLE:
+        print("\t", rsc.address, ":", "UNREACHABLE")
     else:
         print("\t", rsc.address, ":", "UNKNOWN STATE")
+    if rsc.retries:
+        print("\t\t", f"{rsc.retries} request(s) retried")
+    for error in rsc.errors:
+        print("\t\t", error)
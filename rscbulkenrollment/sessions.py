@@ -0,0 +1,54 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Teardown of the sessions opened on RSCs during a run'''
+import functools
+import logging
+from typing import Dict, List, Optional
+
+from rscbulkenrollment.deadline import run_with_deadline
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+LOGOUT_TIMEOUT = 3
+LOGOUT_DEADLINE = 10
+DEFAULT_LOGOUT_WORKERS = 32
+
+
+class SessionManager:
+    '''Context manager that closes the sessions of the RSCs it tracks when the block
+    exits, however it exits. Logouts run at the same time, each one bounded by
+    'timeout' seconds and all of them by 'deadline' seconds, after which the block
+    exits and the process can exit without waiting for them.'''
+
+    def __init__(self, rscs: List[rscpkg.RSC], workers: int = DEFAULT_LOGOUT_WORKERS,
+                 timeout: float = LOGOUT_TIMEOUT, deadline: float = LOGOUT_DEADLINE) -> None:
+        self.rscs = rscs
+        self.workers = workers
+        self.timeout = timeout
+        self.deadline = deadline
+        self.failed: Dict[str, str] = {}
+
+    def __enter__(self) -> 'SessionManager':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close_all()
+
+    def close_all(self) -> Dict[str, str]:
+        '''Logs out of all open sessions and releases the connections.
+        Returns and logs the error of each failed logout, by RSC address.'''
+        to_close = [rsc for rsc in self.rscs if rsc.connection is not None]
+        if not to_close:
+            return self.failed
+
+        outcomes: Dict[int, Optional[Exception]] = {}
+        run_with_deadline([functools.partial(rsc.close, self.timeout) for rsc in to_close],
+                          self.workers, self.deadline, outcomes)
+        for index, rsc in enumerate(to_close):
+            if index not in outcomes:
+                self.failed[rsc.address] = f"logout did not finish within {self.deadline} seconds"
+            elif outcomes[index] is not None:
+                self.failed[rsc.address] = str(outcomes[index])
+
+        for address, error in self.failed.items():
+            logging.error("Failed to logout from %s: %s", address, error)
+        return self.failed
@@ -0,0 +1,80 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Splitting of a run in shards, run on several hosts, and merging of their results'''
+import hashlib
+import json
+import logging
+from typing import Dict, List, Tuple
+
+from rscbulkenrollment.ratelimit import get_subnet
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+SHARD_KEYS = ("address", "subnet")
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    '''Parses a shard given as 'i/N', the i-th of N shards counting from 1.
+    Raises ValueError if it is not valid.'''
+    index, _, count = value.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError as exp:
+        raise ValueError(f"'{value}' is not in the i/N format") from exp
+    if not 1 <= shard[0] <= shard[1]:
+        raise ValueError(f"'{value}' has to be between 1/N and N/N")
+    return shard
+
+def shard_of(address: str, count: int, key: str = "address",
+             subnet_prefix: int = 24) -> int:
+    '''Returns the shard, from 1 to 'count', of an RSC address. With the "subnet" key,
+    all RSCs of a subnet are in the same shard; RSCs given by host name are split by
+    address. The same address always maps to the same shard, on any host.'''
+    value = address
+    if key == "subnet":
+        value = get_subnet(address, subnet_prefix) or address
+    digest = hashlib.sha256(value.lower().encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+def select_shard(rscs: List[rscpkg.RSC], shard: Tuple[int, int], key: str = "address",
+                 subnet_prefix: int = 24) -> List[rscpkg.RSC]:
+    '''Returns the RSCs of the shard (i, N)'''
+    index, count = shard
+    return [rsc for rsc in rscs if shard_of(rsc.address, count, key, subnet_prefix) == index]
+
+def write_results(filename: str, rscs: List[rscpkg.RSC]) -> None:
+    '''Writes the final state of the RSCs to a JSON lines file, one line per RSC.
+    Passwords are never written.'''
+    with open(filename, 'w', encoding='utf-8') as results_file:
+        for rsc in rscs:
+            results_file.write(json.dumps({
+                "address": rsc.address,
+                "state": rsc.monitor_state.name,
+                "user_code": rsc.user_code,
+                "retries": rsc.retries,
+                "errors": rsc.errors,
+            }) + "\n")
+
+def load_results(filenames: List[str]) -> List[rscpkg.RSC]:
+    '''Reads the results of several shards into RSCs holding their final state, in the
+    order of the files. An RSC found in several files keeps its last result.
+    Raises OSError if a file can't be read.'''
+    merged: Dict[str, rscpkg.RSC] = {}
+    for filename in filenames:
+        with open(filename, 'r', encoding='utf-8') as results_file:
+            for line_no, line in enumerate(results_file, 1):
+                try:
+                    entry = json.loads(line)
+                    rsc = rscpkg.RSC(entry["address"], "", "")
+                    rsc.monitor_state = rscpkg.TaskState[entry["state"]]
+                except (ValueError, KeyError, TypeError):
+                    logging.warning("Ignoring invalid line %d of results '%s'", line_no, filename)
+                    continue
+                rsc.user_code = entry.get("user_code") or ""
+                rsc.retries = entry.get("retries") or 0
+                rsc.errors = list(entry.get("errors") or [])
+                if rsc.address in merged:
+                    logging.warning("RSC '%s' is in several results, keeping the one in '%s'",
+                                    rsc.address, filename)
+                    del merged[rsc.address]
+                merged[rsc.address] = rsc
+    return list(merged.values())
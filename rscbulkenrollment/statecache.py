@@ -0,0 +1,128 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''On-disk cache of the RSCs known to be enrolled, to skip them on repeat runs'''
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+SERVICE_ROOT_TIMEOUT = 3
+DEFAULT_SERVICE_ROOT_WORKERS = 64
+ENROLLED_STATES = (rscpkg.TaskState.SUCCESS, rscpkg.TaskState.ALREADY_ENROLLED)
+
+
+class StateCache:
+    '''JSON file with the last known state of each enrolled RSC by address: its UUID,
+    the UUID of its Redfish service, firmware version, a hash of the proxy/NTP settings
+    it was given and when it was last confirmed enrolled. Entries older than 'ttl'
+    seconds are not used. Passwords are never written.'''
+
+    def __init__(self, filename: str, ttl: float = DEFAULT_CACHE_TTL) -> None:
+        self.filename = filename
+        self.ttl = ttl
+        self.entries: Dict[str, Dict] = load_cache(filename)
+
+    def apply(self, rscs: List[rscpkg.RSC], proxy: Optional[str],
+              ntp: Optional[str]) -> List[rscpkg.RSC]:
+        '''Marks as ALREADY_ENROLLED the RSCs confirmed enrolled within the TTL with the
+        same proxy/NTP settings, so they are skipped. Returns these RSCs.
+        An RSC is only skipped if the UUID of its service root, read in this run (see
+        read_service_uuids), is the one recorded: an address now used by another RSC
+        is checked again. RSCs whose service root was not read are never skipped.'''
+        wanted = settings_hash(proxy, ntp)
+        now = time.time()
+        skipped = []
+        for rsc in rscs:
+            entry = self.entries.get(rsc.address)
+            if entry is None or now - entry.get("checked_at", 0) > self.ttl:
+                continue
+            if wanted and entry.get("settings_hash") != wanted:
+                continue
+            if not rsc.service_uuid or entry.get("service_uuid") != rsc.service_uuid:
+                logging.info("RSC '%s' is not the cached one or did not answer,"
+                             " checking it again", rsc.address)
+                continue
+            rsc.monitor_state = rscpkg.TaskState.ALREADY_ENROLLED
+            rsc.uuid = entry.get("uuid", "")
+            rsc.firmware_version = entry.get("firmware_version", "")
+            skipped.append(rsc)
+        return skipped
+
+    def update(self, rscs: List[rscpkg.RSC], proxy: Optional[str], ntp: Optional[str],
+               skipped: Optional[List[rscpkg.RSC]] = None) -> None:
+        '''Records the RSCs that ended the run enrolled and forgets the others, so they
+        are checked again next time. The entries of 'skipped' RSCs are kept as they are.
+        Without proxy/NTP settings, the settings recorded before are kept.'''
+        skipped_addresses = {rsc.address for rsc in skipped or []}
+        now = time.time()
+        for rsc in rscs:
+            if rsc.address in skipped_addresses:
+                continue
+            if rsc.monitor_state not in ENROLLED_STATES:
+                self.entries.pop(rsc.address, None)
+                continue
+            previous = self.entries.get(rsc.address, {})
+            if rsc.uuid and previous.get("uuid") and previous["uuid"] != rsc.uuid:
+                logging.info("RSC '%s' was replaced, its UUID changed", rsc.address)
+            self.entries[rsc.address] = {
+                "uuid": rsc.uuid,
+                "service_uuid": rsc.service_uuid,
+                "firmware_version": rsc.firmware_version,
+                "settings_hash": settings_hash(proxy, ntp) or previous.get("settings_hash", ""),
+                "checked_at": now,
+            }
+
+    def save(self) -> None:
+        '''Writes the cache file, replacing it atomically'''
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, 'w', encoding='utf-8') as cache_file:
+            json.dump(self.entries, cache_file, indent=2)
+        os.replace(temp_filename, self.filename)
+
+
+def load_cache(filename: str) -> Dict[str, Dict]:
+    '''Reads the cache entries by address. A missing or invalid cache has no entries.'''
+    try:
+        with open(filename, 'r', encoding='utf-8') as cache_file:
+            entries = json.load(cache_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logging.warning("Ignoring invalid state cache '%s'", filename)
+        return {}
+    if not isinstance(entries, dict):
+        logging.warning("Ignoring invalid state cache '%s'", filename)
+        return {}
+    return {address: entry for address, entry in entries.items() if isinstance(entry, dict)}
+
+
+def read_service_uuids(rscs: List[rscpkg.RSC], timeout: float = SERVICE_ROOT_TIMEOUT,
+                       workers: int = DEFAULT_SERVICE_ROOT_WORKERS) -> None:
+    '''Reads, without logging in, the service root of the RSCs whose service UUID is not
+    known yet, up to 'workers' RSCs at a time. RSCs that don't answer are left unknown.'''
+    def read(rsc: rscpkg.RSC) -> None:
+        try:
+            rsc.check_service_root(timeout)
+        except rscpkg.RSCException as exp:
+            logging.debug(exp)
+
+    unknown = [rsc for rsc in rscs if not rsc.service_uuid]
+    if len(unknown) == 1:
+        read(unknown[0])
+    elif unknown:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unknown)))) as executor:
+            list(executor.map(read, unknown))
+
+
+def settings_hash(proxy: Optional[str], ntp: Optional[str]) -> str:
+    '''Hash of the proxy/NTP settings given to RSCs, empty if none were given'''
+    settings = rscpkg.get_proxy_ntp_settings(proxy or "", ntp or "")
+    if not settings:
+        return ""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
@@ -0,0 +1,308 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''Local Redfish simulator of many RSCs, for tests and benchmarks.
+
+All simulated RSCs share one HTTPS address. A device is told apart by its
+password at login and by its session token afterwards, so every device has
+its own password.'''
+
+import json
+import os
+import random
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+import pytest
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+TASK_MONITOR = "/redfish/v1/TaskService/TaskMonitors/1"
+
+
+class Device:
+    '''State of a simulated RSC'''
+
+    def __init__(self, index: int, password_change_required: bool) -> None:
+        self.index = index
+        self.password = f"Password-{index}"
+        self.new_password = f"NewPassword-{index}"
+        self.password_change_required = password_change_required
+        self.enrolled = False
+        self.bind_started: Optional[float] = None
+        self.user_code = f"CODE{index:05d}"
+        self.uuid = str(uuid.UUID(int=index))
+        self.network = {"Proxy": {"Enabled": False, "ProxyServerURI": ""},
+                        "NTP": {"NTPServers": [], "ProtocolEnabled": False}}
+        self.pending_network: Optional[Dict] = None
+        self.network_applied = 0.0
+        self.settings_patches = 0
+
+
+class RedfishSimulator:
+    '''Redfish service of 'devices' RSCs. Each request waits 'latency' seconds and fails
+    with a 503 with probability 'error_rate'. Enrollment task monitors answer 202 for
+    'bind_duration' seconds, with 'retry_after' as Retry-After, and then 200.
+    Proxy/NTP changes are reported 'settings_delay' seconds after they are made.
+    With 'select_query' set, the service root advertises the $select query, which
+    Managers/1 then "honor"s, "ignore"s or "reject"s with a 400. Devices that require a
+    password change answer 403 to anything but the account and their sessions. The service root has
+    'service_uuid' as UUID, shared by all devices.'''
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, devices: int, *, latency: float = 0.0, error_rate: float = 0.0,
+                 bind_duration: float = 0.0, retry_after: int = 1,
+                 settings_delay: float = 0.0, select_query: Optional[str] = None,
+                 password_change_required: bool = False) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bind_duration = bind_duration
+        self.retry_after = retry_after
+        self.settings_delay = settings_delay
+        self.select_query = select_query
+        self.service_uuid = str(uuid.uuid4())
+        self.devices = [Device(i, password_change_required) for i in range(devices)]
+        self.by_password: Dict[str, Device] = {dev.password: dev for dev in self.devices}
+        self.sessions: Dict[str, Device] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.select_requests = 0
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.certdir = ""
+
+    @property
+    def address(self) -> str:
+        '''Address shared by all simulated RSCs'''
+        return f"127.0.0.1:{self.server.server_address[1]}"
+
+    def rscs(self) -> List[rscpkg.RSC]:
+        '''RSC objects for all simulated devices'''
+        return [rscpkg.RSC(self.address, dev.password, dev.new_password) for dev in self.devices]
+
+    def __enter__(self) -> 'RedfishSimulator':
+        if shutil.which("openssl") is None:
+            pytest.skip("openssl is needed to create the simulator certificate")
+        self.certdir = tempfile.mkdtemp()
+        cert = os.path.join(self.certdir, "cert.pem")
+        key = os.path.join(self.certdir, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                        "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=localhost"],
+                       check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+
+        simulator = self
+
+        class Handler(RedfishHandler):
+            '''Handler bound to this simulator'''
+            sim = simulator
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.certdir, ignore_errors=True)
+
+
+class RedfishHandler(BaseHTTPRequestHandler):
+    '''Serves the Redfish resources used by the enrollment tool'''
+    sim: RedfishSimulator
+    protocol_version = "HTTP/1.1"
+    timeout = 5
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        '''Handles GET requests'''
+        self.handle_request("GET")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        '''Handles POST requests'''
+        self.handle_request("POST")
+
+    def do_PATCH(self):  # pylint: disable=invalid-name
+        '''Handles PATCH requests'''
+        self.handle_request("PATCH")
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        '''Handles DELETE requests'''
+        self.handle_request("DELETE")
+
+    def handle_request(self, method: str) -> None:
+        '''Routes a request to the simulated device'''
+        # pylint: disable=too-many-return-statements,too-many-branches
+        sim = self.sim
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        with sim.lock:
+            sim.requests += 1
+        if sim.latency:
+            time.sleep(sim.latency)
+        if sim.error_rate and random.random() < sim.error_rate:
+            self.send_error_json(503, "Service temporarily unavailable")
+            return
+
+        path, _, query = self.path.partition("?")
+        path = path.rstrip("/")
+        select = parse_qs(query).get("$select", [""])[0]
+        if method == "GET" and path == "/redfish/v1":
+            root: Dict = {"RedfishVersion": "1.11.0", "UUID": sim.service_uuid}
+            if sim.select_query:
+                root["ProtocolFeaturesSupported"] = {"SelectQuery": True}
+            self.send_json(200, root)
+            return
+        if method == "POST" and path == "/redfish/v1/SessionService/Sessions":
+            self.login(body)
+            return
+
+        with sim.lock:
+            device = sim.sessions.get(self.headers.get(rscpkg.TOKEN_HEADER_NAME, ""))
+        if device is None:
+            self.send_error_json(401, "Unauthorized")
+            return
+
+        if (device.password_change_required and path != "/redfish/v1/AccountService/Accounts/1"
+                and not path.startswith("/redfish/v1/SessionService/Sessions/")):
+            self.send_error_json(403, "The password must be changed: PasswordChangeRequired")
+            return
+
+        if method == "DELETE" and path.startswith("/redfish/v1/SessionService/Sessions/"):
+            with sim.lock:
+                sim.sessions.pop(self.headers[rscpkg.TOKEN_HEADER_NAME], None)
+            self.send_json(204)
+        elif path == "/redfish/v1/AccountService/Accounts/1":
+            self.account(method, device, body)
+        elif method == "GET" and path == "/redfish/v1/Managers/1":
+            self.manager(device, select)
+        elif path == "/redfish/v1/Managers/1/NetworkProtocol":
+            self.network_protocol(method, device, body)
+        elif method == "POST" and path == "/redfish/v1/Managers/1/Oem/HP/Actions/HP.BindToCloud":
+            device.bind_started = time.monotonic()
+            self.send_json(202, {"User_code": device.user_code}, {"Location": TASK_MONITOR})
+        elif path == TASK_MONITOR:
+            self.task_monitor(method, device)
+        else:
+            self.send_error_json(404, "Resource not found")
+
+    def login(self, body: Dict) -> None:
+        '''Creates a session for the device with the password given'''
+        with self.sim.lock:
+            device = self.sim.by_password.get(body.get("Password"))
+            if device is None:
+                self.send_error_json(401, "Invalid username or password")
+                return
+            token = uuid.uuid4().hex
+            self.sim.sessions[token] = device
+        self.send_json(201, {"Id": token[:8]}, {rscpkg.TOKEN_HEADER_NAME: token})
+
+    def account(self, method: str, device: Device, body: Dict) -> None:
+        '''Reads or changes the administrator account'''
+        if method == "GET":
+            self.send_json(200, {"PasswordChangeRequired": device.password_change_required})
+        elif method == "PATCH" and "Password" in body:
+            with self.sim.lock:
+                del self.sim.by_password[device.password]
+                device.password = body["Password"]
+                device.password_change_required = False
+                self.sim.by_password[device.password] = device
+            self.send_json(200, {})
+        else:
+            self.send_error_json(405, "Method not allowed")
+
+    def manager(self, device: Device, select: str) -> None:
+        '''Reads Managers/1, with only the properties in 'select' if the query is honored'''
+        status = "Enrolled" if device.enrolled else "NotEnrolled"
+        body = {"Id": "1", "Name": "Manager", "ManagerType": "BMC",
+                "UUID": device.uuid, "FirmwareVersion": "1.2.3",
+                "Oem": {"HP": {"HPRemoteSystemManagerBindingStatus": {
+                    "BindingStatus": status, "Links": {}}}}}
+        if select:
+            with self.sim.lock:
+                self.sim.select_requests += 1
+            if self.sim.select_query == "reject":
+                self.send_error_json(400, "Query parameter $select is not supported")
+                return
+            if self.sim.select_query == "honor":
+                body = select_properties(body, select.split(","))
+        self.send_json(200, body)
+
+    def network_protocol(self, method: str, device: Device, body: Dict) -> None:
+        '''Reads or changes the proxy and NTP settings'''
+        with self.sim.lock:
+            if device.pending_network and time.monotonic() >= device.network_applied:
+                device.network, device.pending_network = device.pending_network, None
+            if method == "GET":
+                network = device.network
+            elif method == "PATCH":
+                network = {key: dict(value) for key, value in device.network.items()}
+                for key, value in body.items():
+                    network.setdefault(key, {}).update(value)
+                device.pending_network = network
+                device.network_applied = time.monotonic() + self.sim.settings_delay
+                device.settings_patches += 1
+                network = {}
+            else:
+                network = None
+        if network is None:
+            self.send_error_json(405, "Method not allowed")
+        else:
+            self.send_json(200, network)
+
+    def task_monitor(self, method: str, device: Device) -> None:
+        '''Reports or cancels the enrollment task of the device'''
+        if device.bind_started is None:
+            self.send_error_json(404, "No enrollment in progress")
+        elif method == "DELETE":
+            device.bind_started = None
+            self.send_json(204)
+        elif time.monotonic() - device.bind_started < self.sim.bind_duration:
+            self.send_json(202, {}, {"Retry-After": str(self.sim.retry_after)})
+        else:
+            device.enrolled = True
+            self.send_json(200, {})
+
+    def send_json(self, status: int, body: Optional[Dict] = None,
+                  headers: Optional[Dict[str, str]] = None) -> None:
+        '''Sends a JSON response'''
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status: int, message: str) -> None:
+        '''Sends a Redfish error response'''
+        self.send_json(status, {"error": {"@Message.ExtendedInfo": [{"Message": message}]}})
+
+
+def select_properties(body: Dict, paths: List[str]) -> Dict:
+    '''Keeps only the properties of 'body' in 'paths', given as 'A/B/C' '''
+    selected: Dict = {}
+    for path in paths:
+        source, target = body, selected
+        *parents, name = path.split("/")
+        for parent in parents:
+            source = source.get(parent, {})
+            target = target.setdefault(parent, {})
+        if name in source:
+            target[name] = source[name]
+    return selected
@@ -0,0 +1,142 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+import pytest
+from rscbulkenrollment.metrics import Metrics
+from rscbulkenrollment.rsc import async_rsc
+from rscbulkenrollment.rsc import rsc as rscpkg
+from tests.simulator import RedfishSimulator
+
+def run(simulator, test):
+    '''Runs test(AsyncRSC) for each simulated device, with one shared ClientSession'''
+    async def main():
+        async with async_rsc.create_http_session() as http:
+            clients = [async_rsc.AsyncRSC(rsc, http) for rsc in simulator.rscs()]
+            results = await async_rsc.gather_bounded([test(client) for client in clients], 4)
+            await asyncio.gather(*[client.close() for client in clients])
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return clients
+    return asyncio.run(main())
+
+def test_async_enroll_simulated_rscs():
+    with RedfishSimulator(3, password_change_required=True, select_query="honor") as simulator:
+        async def enroll(client):
+            await client.check_service_root()
+            assert client.rsc.select_supported is True
+            await client.login()
+            assert await client.check_needs_change_password() is True
+            await client.change_password()
+            assert client.session_id == ""
+            await client.login()
+            assert await client.check_needs_change_password() is False
+            assert await client.is_enrolled_to_cloud() is False
+            assert await client.set_proxy_ntp_settings("http://proxy:8080", "pool.ntp.org",
+                                                       ready_timeout=1) is True
+            assert await client.set_proxy_ntp_settings("http://proxy:8080", "pool.ntp.org")\
+                is False
+            settings = await client.read_proxy_ntp_settings()
+            assert settings["Proxy"]["ProxyServerURI"] == "http://proxy:8080"
+            await client.enroll_to_cloud()
+            assert client.rsc.monitor_state == rscpkg.TaskState.IN_PROGRESS
+            assert await client.get_bind_status() == rscpkg.TaskState.SUCCESS
+            assert await client.is_enrolled_to_cloud() is True
+
+        clients = run(simulator, enroll)
+        assert simulator.select_requests == 9
+        assert not simulator.sessions
+        for client, device in zip(clients, simulator.devices):
+            assert client.rsc.current_password == device.password == device.new_password
+            assert client.rsc.user_code == device.user_code
+            assert client.rsc.uuid == device.uuid
+            assert client.rsc.firmware_version == "1.2.3"
+            assert client.rsc.monitor_state == rscpkg.TaskState.ALREADY_ENROLLED
+            assert device.settings_patches == 1
+
+def test_async_cancel_enrollment():
+    with RedfishSimulator(1, bind_duration=60, retry_after=7) as simulator:
+        async def cancel(client):
+            await client.login()
+            await client.enroll_to_cloud(check_enrolled=False)
+            assert await client.get_bind_status() == rscpkg.TaskState.IN_PROGRESS
+            assert client.rsc.bind_retry_after == 7
+            await client.cancel_enrollment(timeout=3)
+            with pytest.raises(rscpkg.RSCException) as exp:
+                await client.get_bind_status()
+            assert exp.value.status_code == 404
+
+        run(simulator, cancel)
+        assert simulator.devices[0].bind_started is None
+
+def test_async_relogin_and_login_errors():
+    with RedfishSimulator(1) as simulator:
+        async def relogin(client):
+            await client.login()
+            simulator.sessions.clear()
+            assert await client.check_needs_change_password() is False
+            assert client.rsc.retries == 1
+            await client.logout()
+            client.rsc.current_password = "wrong"
+            with pytest.raises(rscpkg.RSCException) as exp:
+                await client.login()
+            assert exp.value.status_code == 401
+            assert "Invalid username or password" in str(exp.value)
+
+        run(simulator, relogin)
+
+def test_async_select_rejected():
+    with RedfishSimulator(1, select_query="reject") as simulator:
+        async def read(client):
+            await client.check_service_root()
+            await client.login()
+            assert await client.is_enrolled_to_cloud() is False
+            assert await client.is_enrolled_to_cloud() is False
+            assert client.rsc.select_supported is False
+
+        run(simulator, read)
+        assert simulator.select_requests == 1
+
+def test_async_retries_and_breaker(monkeypatch):
+    monkeypatch.setattr(async_rsc, "get_retry_delay", lambda policy, attempt, response: 0)
+    metrics = Metrics()
+    monkeypatch.setattr(async_rsc, "METRICS", metrics)
+    monkeypatch.setattr(rscpkg, "METRICS", metrics)
+    with RedfishSimulator(1) as simulator:
+        async def failing(client):
+            await client.login()
+            simulator.error_rate = 1.0
+            with pytest.raises(rscpkg.RSCException) as exp:
+                await client.check_needs_change_password()
+            assert exp.value.status_code == 503
+            assert client.rsc.retries == 3
+            requests_before = simulator.requests
+            with pytest.raises(rscpkg.RSCException, match="keeps failing"):
+                await client.check_needs_change_password()
+            assert simulator.requests == requests_before + 1
+            simulator.error_rate = 0.0
+            client.drop_session()
+
+        run(simulator, failing)
+    assert metrics.errors[("check if password needs change", "HTTP 503")] == 5
+    assert metrics.retries["check if password needs change"] == 4
+
+def test_gather_bounded():
+    running = []
+    peak = []
+
+    async def task(number):
+        running.append(number)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(number)
+        if number == 3:
+            raise ValueError(number)
+        return number
+
+    results = asyncio.run(async_rsc.gather_bounded([task(n) for n in range(10)], 3))
+    assert max(peak) == 3
+    assert results[:3] == [0, 1, 2]
+    assert isinstance(results[3], ValueError)
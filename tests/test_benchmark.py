@@ -0,0 +1,91 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+'''End-to-end enrollment benchmarks against the Redfish simulator, and CSV import memory.
+Enrollments of more than 10 RSCs and imports of more than 10000 are marked slow: run them
+with 'pytest -m slow'.'''
+
+import time
+import tracemalloc
+
+import pytest
+from rscbulkenrollment import cloudenrollment, sessions
+from rscbulkenrollment.discovery import importer
+from rscbulkenrollment.rsc import rsc as rscpkg
+from tests.simulator import RedfishSimulator
+
+pytest.importorskip("pytest_benchmark")
+
+pytestmark = pytest.mark.filterwarnings(
+    "ignore::urllib3.exceptions.InsecureRequestWarning")
+
+# Peak memory of importing RSCs from a CSV file, per RSC, most of it being the RSC object
+# and its address and passwords
+MAX_IMPORT_BYTES_PER_RSC = 800
+
+SIZES = [10, pytest.param(1000, marks=pytest.mark.slow),
+         pytest.param(10000, marks=pytest.mark.slow)]
+
+def enroll_all(rscs, phases):
+    start = time.perf_counter()
+    with sessions.SessionManager(rscs):
+        rscs_to_monitor = cloudenrollment.bind_rscs_to_cloud(rscs, "", "")
+        phases["bind_seconds"] = time.perf_counter() - start
+        cloudenrollment.monitor_rscs(rscs_to_monitor)
+        phases["monitor_seconds"] = time.perf_counter() - start - phases["bind_seconds"]
+        logout_start = time.perf_counter()
+    phases["logout_seconds"] = time.perf_counter() - logout_start
+    return rscs
+
+def check_enrolled(rscs, simulator):
+    assert all(rsc.monitor_state == rscpkg.TaskState.SUCCESS for rsc in rscs)
+    assert all(dev.enrolled for dev in simulator.devices)
+
+@pytest.mark.parametrize("devices", SIZES)
+def test_enrollment_throughput(benchmark, devices):
+    with RedfishSimulator(devices, latency=0.005, bind_duration=0.5) as simulator:
+        phases = {}
+        rscs = benchmark.pedantic(enroll_all, setup=lambda: ((simulator.rscs(), phases), {}),
+                                  rounds=1, iterations=1)
+        check_enrolled(rscs, simulator)
+
+        benchmark.extra_info.update(phases)
+        benchmark.extra_info["requests"] = simulator.requests
+        benchmark.extra_info["rscs_per_second"] = devices / benchmark.stats.stats.max
+
+@pytest.mark.parametrize("devices", SIZES)
+def test_enrollment_memory(benchmark, devices):
+    def enroll_traced(rscs):
+        tracemalloc.start()
+        try:
+            enroll_all(rscs, {})
+            benchmark.extra_info["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return rscs
+
+    with RedfishSimulator(devices, bind_duration=0.5) as simulator:
+        rscs = benchmark.pedantic(enroll_traced, setup=lambda: ((simulator.rscs(),), {}),
+                                  rounds=1, iterations=1)
+        check_enrolled(rscs, simulator)
+
+@pytest.mark.parametrize("rows", [10000, pytest.param(100000, marks=pytest.mark.slow)])
+def test_import_memory(benchmark, tmp_path, rows):
+    filename = tmp_path / "rscs.csv"
+    filename.write_text("".join(f"10.{i // 65536}.{i // 256 % 256}.{i % 256},Password-{i},"
+                                f"NewPassword-{i}\n" for i in range(rows)))
+
+    def import_traced():
+        tracemalloc.start()
+        try:
+            rscs = importer.import_rscs(filename=str(filename))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_bytes"] = peak
+        benchmark.extra_info["bytes_per_rsc"] = peak / rows
+        return rscs
+
+    rscs = benchmark.pedantic(import_traced, rounds=1, iterations=1)
+    assert len(rscs) == rows
+    assert all(rsc.breaker is None and rsc.connection is None for rsc in rscs)
+    assert benchmark.extra_info["bytes_per_rsc"] < MAX_IMPORT_BYTES_PER_RSC
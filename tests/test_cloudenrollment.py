@@ -0,0 +1,367 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from rscbulkenrollment import cloudenrollment, journal, sessions
+from rscbulkenrollment.rsc import rsc as rscpkg
+from tests.simulator import RedfishSimulator
+
+class FakeRSC(rscpkg.RSC):
+    def __init__(self, address, states):
+        super().__init__(address, "", "")
+        self.bind_monitor = "/redfish/v1/TaskService/TaskMonitors/1"
+        self.monitor_state = rscpkg.TaskState.IN_PROGRESS
+        self.states = list(states)
+        self.polls = 0
+
+    def get_bind_status(self):
+        self.polls += 1
+        state = self.states.pop(0)
+        if isinstance(state, Exception):
+            raise state
+        self.bind_retry_after = 0.01
+        self.monitor_state = state
+        return state
+
+def test_monitor_polls_until_complete(monkeypatch):
+    monkeypatch.setattr(cloudenrollment, "MONITOR_INTERVAL", 0.01)
+    monkeypatch.setattr(cloudenrollment, "MONITOR_MIN_INTERVAL", 0)
+    fast = FakeRSC("fast", [rscpkg.TaskState.SUCCESS])
+    slow = FakeRSC("slow", [rscpkg.TaskState.IN_PROGRESS, rscpkg.RSCException("timeout"),
+                            rscpkg.TaskState.IN_PROGRESS, rscpkg.TaskState.SUCCESS])
+
+    cloudenrollment.monitor_rscs([fast, slow], workers=2)
+
+    assert fast.polls == 1
+    assert slow.polls == 4
+    assert slow.monitor_state == rscpkg.TaskState.SUCCESS
+
+def test_get_backoff(monkeypatch):
+    monkeypatch.setattr(cloudenrollment, "MONITOR_INTERVAL", 5)
+    monkeypatch.setattr(cloudenrollment, "MONITOR_MAX_BACKOFF", 60)
+    assert cloudenrollment.get_backoff(1) == 10
+    assert cloudenrollment.get_backoff(2) == 20
+    assert cloudenrollment.get_backoff(10) == 60
+
+def test_get_poll_interval(monkeypatch):
+    monkeypatch.setattr(cloudenrollment, "MONITOR_INTERVAL", 5)
+    monkeypatch.setattr(cloudenrollment, "MONITOR_MIN_INTERVAL", 1)
+    monkeypatch.setattr(cloudenrollment, "MONITOR_MAX_BACKOFF", 60)
+    rsc = rscpkg.RSC("192.168.0.10", "password", "")
+    assert cloudenrollment.get_poll_interval(rsc) == 5
+    rsc.bind_retry_after = 0
+    assert cloudenrollment.get_poll_interval(rsc) == 1
+    rsc.bind_retry_after = 2.5
+    assert cloudenrollment.get_poll_interval(rsc) == 2.5
+    rsc.bind_retry_after = 86400
+    assert cloudenrollment.get_poll_interval(rsc) == 60
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_retry_after_zero_not_polled_in_a_loop():
+    with RedfishSimulator(2, bind_duration=1.5, retry_after=0) as simulator:
+        rscs = simulator.rscs()
+        rscs_to_monitor = cloudenrollment.bind_rscs_to_cloud(rscs, "", "")
+        requests_before = simulator.requests
+        cloudenrollment.monitor_rscs(rscs_to_monitor)
+        assert all(rsc.monitor_state == rscpkg.TaskState.SUCCESS for rsc in rscs)
+        assert simulator.requests - requests_before <= 6
+
+class PipelineRSC(rscpkg.RSC):
+    def __init__(self, address, new_password=""):
+        super().__init__(address, "old", new_password)
+        self.calls = []
+
+    def login(self):
+        self.calls.append("login")
+
+    def check_needs_change_password(self):
+        self.calls.append("check")
+        self.password_change_required = True
+        return True
+
+    def change_password(self):
+        self.calls.append("change")
+        self.password_change_required = False
+
+    def is_enrolled_to_cloud(self):
+        self.calls.append("is_enrolled")
+        return False
+
+    def enroll_to_cloud(self, check_enrolled=True):
+        self.calls.append(("enroll", check_enrolled))
+
+def test_bind_reuses_validation():
+    rsc = PipelineRSC("validated", "new")
+    rsc.password_change_required = False
+
+    assert cloudenrollment.bind_rsc_to_cloud(rsc, None, None)
+    assert rsc.calls == ["login", "is_enrolled", ("enroll", False)]
+
+def test_bind_requires_new_password():
+    rsc = PipelineRSC("no-new-password")
+
+    assert not cloudenrollment.bind_rsc_to_cloud(rsc, None, None)
+    assert rsc.calls == ["login", "check"]
+    assert len(rsc.errors) == 1
+
+def test_password_change_journaled_before_enroll(tmp_path):
+    class CrashingRSC(PipelineRSC):
+        def change_password(self):
+            super().change_password()
+            self.current_password = self.new_password
+
+        def is_enrolled_to_cloud(self):
+            raise RuntimeError("crash")
+
+    filename = str(tmp_path / "run.jsonl")
+    run_journal = journal.Journal(filename)
+    with pytest.raises(RuntimeError):
+        cloudenrollment.bind_rsc_to_cloud(CrashingRSC("192.168.0.1", "new"), None, None,
+                                          journal=run_journal)
+    run_journal.close()
+
+    entries = journal.load_journal(filename)
+    assert entries["192.168.0.1"]["stage"] == "password"
+    rsc = rscpkg.RSC("192.168.0.1", "old", "new")
+    journal.resume_rscs([rsc], entries)
+    assert rsc.current_password == "new"
+    assert rsc.password_change_required is False
+
+def test_interrupted_bind_drops_queued_rscs(monkeypatch, tmp_path):
+    started = []
+
+    def bind(rsc, proxy, ntp, journal=None):
+        started.append(rsc.address)
+        time.sleep(0.2)
+        return True
+
+    monkeypatch.setattr(cloudenrollment, "bind_rsc_to_cloud", bind)
+    rscs = [rscpkg.RSC(f"192.168.0.{i}", "password", "") for i in range(100)]
+    run_journal = journal.Journal(str(tmp_path / "run.jsonl"))
+    threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGINT)).start()
+    with pytest.raises(KeyboardInterrupt):
+        cloudenrollment.bind_rscs_to_cloud(rscs, "", "", workers=4, journal=run_journal)
+    run_journal.close()
+    assert 4 <= len(started) <= 12
+    assert len(journal.load_journal(str(tmp_path / "run.jsonl"))) == len(started)
+    time.sleep(0.5)
+    assert len(started) <= 12
+
+def test_binder_skips_rscs(monkeypatch):
+    monkeypatch.setattr(cloudenrollment, "bind_rsc_to_cloud",
+                        lambda rsc, proxy, ntp, journal=None: True)
+    rscs = [rscpkg.RSC(f"192.168.0.{i}", "password", "") for i in range(4)]
+    with cloudenrollment.CloudBinder("", "", skip=lambda rsc: rsc is rscs[1]) as binder:
+        for rsc in rscs:
+            binder.submit(rsc)
+    assert binder.started() == [rscs[0], rscs[2], rscs[3]]
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_enroll_simulated_rscs():
+    with RedfishSimulator(10, password_change_required=True) as simulator:
+        rscs = simulator.rscs()
+        with sessions.SessionManager(rscs) as manager:
+            rscs_to_monitor = cloudenrollment.bind_rscs_to_cloud(rscs, "", "", workers=4)
+            cloudenrollment.monitor_rscs(rscs_to_monitor, workers=4)
+
+    assert rscs_to_monitor == rscs
+    assert all(rsc.monitor_state == rscpkg.TaskState.SUCCESS for rsc in rscs)
+    assert all(dev.enrolled and not dev.password_change_required for dev in simulator.devices)
+    assert not manager.failed
+    assert not simulator.sessions
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_proxy_ntp_settings_only_changed_once():
+    with RedfishSimulator(1, settings_delay=0.3) as simulator:
+        rsc = simulator.rscs()[0]
+        rsc.login()
+        assert rsc.set_proxy_ntp_settings("http://proxy:8080", "ntp.org")
+        assert simulator.devices[0].network["NTP"]["NTPServers"] == ["ntp.org"]
+        assert not rsc.set_proxy_ntp_settings("http://proxy:8080", "ntp.org")
+        assert not rsc.set_proxy_ntp_settings("", "ntp.org")
+        assert simulator.devices[0].settings_patches == 1
+        rsc.close()
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_reconcile_only_sends_needed_requests():
+    with RedfishSimulator(4) as simulator:
+        for dev in simulator.devices[:3]:
+            dev.enrolled = True
+            dev.network["NTP"] = {"NTPServers": ["ntp.org"], "ProtocolEnabled": True}
+        rscs = simulator.rscs()
+        started = cloudenrollment.bind_rscs_to_cloud(rscs, "", "ntp.org", reconcile=True)
+
+        assert started == rscs[3:]
+        assert [rsc.monitor_state for rsc in rscs[:3]] == [rscpkg.TaskState.ALREADY_ENROLLED] * 3
+        # login and two GETs for each enrolled RSC; the other one also checks its
+        # password, changes and probes the settings, and enrolls
+        assert simulator.requests == 3 * 3 + 7
+        assert [dev.settings_patches for dev in simulator.devices] == [0, 0, 0, 1]
+        for rsc in rscs:
+            rsc.close()
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_reconcile_fresh_rsc(tmp_path):
+    with RedfishSimulator(1, password_change_required=True) as simulator:
+        rscs = simulator.rscs()
+        run_journal = journal.Journal(str(tmp_path / "run.jsonl"))
+        started = cloudenrollment.bind_rscs_to_cloud(rscs, "", "ntp.org", reconcile=True,
+                                                     journal=run_journal)
+        run_journal.close()
+
+        assert started == rscs
+        assert not rscs[0].errors
+        assert rscs[0].current_password == simulator.devices[0].new_password
+        assert not simulator.devices[0].password_change_required
+        assert simulator.devices[0].bind_started is not None
+        assert simulator.devices[0].settings_patches == 1
+        entries = journal.load_journal(str(tmp_path / "run.jsonl"))
+        assert entries[rscs[0].address]["password_changed"]
+        rscs[0].close()
+
+def make_coded_rscs(count):
+    rscs = []
+    for index in range(count):
+        rsc = rscpkg.RSC(f"192.168.0.{index}", "", "")
+        rsc.user_code = f"CODE{index}"
+        rscs.append(rsc)
+    return rscs
+
+def test_verification_batches(tmp_path, capsys):
+    rscs = make_coded_rscs(5) + [rscpkg.RSC("192.168.1.1", "", "")]
+    batches = cloudenrollment.print_verification_uri(rscs, batch_size=2,
+                                                     directory=str(tmp_path))
+    assert [len(batch.rscs) for batch in batches] == [2, 2, 1]
+    assert batches[1].uri == cloudenrollment.VERIFICATION_URI + "CODE2,CODE3"
+    assert batches[1].uri in capsys.readouterr().out
+
+    assert (tmp_path / "batch-002.txt").read_text().startswith(batches[1].uri)
+    assert "CODE4" in (tmp_path / "batch-003.html").read_text()
+    assert (tmp_path / "devices.csv").read_text().splitlines()[3] == "192.168.0.2,CODE2,2"
+    assert len((tmp_path / "batches.csv").read_text().splitlines()) == 4
+
+def test_batch_progress(capsys):
+    rscs = make_coded_rscs(3)
+    progress = cloudenrollment.BatchProgress(cloudenrollment.make_batches(rscs, 2))
+    rscs[1].monitor_state = rscpkg.TaskState.SUCCESS
+    progress.complete(rscs[1])
+    rscs[0].monitor_state = rscpkg.TaskState.ERROR
+    progress.complete(rscs[0])
+    assert capsys.readouterr().out.splitlines() == [
+        "Batch 1: 1/2 complete, 1 enrolled", "Batch 1: 2/2 complete, 1 enrolled"]
+
+def test_no_user_codes():
+    rscs = [rscpkg.RSC("192.168.0.1", "", "")]
+    assert cloudenrollment.print_verification_uri(rscs) == []
+    assert rscs[0].monitor_state == rscpkg.TaskState.ERROR
+
+class CancelRSC(rscpkg.RSC):
+    def __init__(self, address, delay=0.0, error=None):
+        super().__init__(address, "", "")
+        self.bind_monitor = "/redfish/v1/TaskService/TaskMonitors/1"
+        self.monitor_state = rscpkg.TaskState.IN_PROGRESS
+        self.delay = delay
+        self.error = error
+
+    def cancel_enrollment(self, timeout=rscpkg.DEFAULT_TIMEOUT, retry=True):
+        assert not retry
+        time.sleep(self.delay)
+        if self.error:
+            raise rscpkg.RSCException(self.error)
+
+def test_cancel_bounded_by_deadline(tmp_path):
+    rscs = [CancelRSC("ok"), CancelRSC("slow", delay=2), CancelRSC("failing", error="refused"),
+            CancelRSC("ok2", delay=0.05)]
+    rscs[3].monitor_state = rscpkg.TaskState.SUCCESS
+    run_journal = journal.Journal(str(tmp_path / "run.jsonl"))
+
+    start = time.monotonic()
+    pending = cloudenrollment.cancel_rscs(rscs, run_journal, deadline=0.5)
+    run_journal.close()
+
+    assert time.monotonic() - start < 1.5
+    assert pending == [rscs[1], rscs[2]]
+    assert rscs[0].monitor_state == rscpkg.TaskState.CANCELLED
+    assert rscs[1].monitor_state == rscpkg.TaskState.IN_PROGRESS
+    assert "within 0.5 seconds" in rscs[1].errors[0]
+    assert "refused" in rscs[2].errors[0]
+    entries = journal.load_journal(str(tmp_path / "run.jsonl"))
+    assert entries["slow"]["state"] == "IN_PROGRESS"
+    assert entries["ok"]["state"] == "CANCELLED"
+    assert "ok2" not in entries
+
+class PollingRSC(CancelRSC):
+    '''Answers its poll after 'poll_delay' seconds with 'status_code', or is interrupted'''
+    def __init__(self, address, poll_delay=0.0, status_code=None):
+        super().__init__(address)
+        self.poll_delay = poll_delay
+        self.status_code = status_code
+
+    def get_bind_status(self):
+        time.sleep(self.poll_delay)
+        if self.status_code is None:
+            raise KeyboardInterrupt
+        return self.record_bind_status(self.status_code, None)
+
+@pytest.mark.parametrize("status_code", [202, 500])
+def test_late_poll_keeps_cancelled_state(tmp_path, status_code):
+    rscs = [PollingRSC("late", poll_delay=0.3, status_code=status_code),
+            PollingRSC("interrupted")]
+    run_journal = journal.Journal(str(tmp_path / "run.jsonl"))
+
+    cloudenrollment.monitor_rscs(rscs, workers=2, journal=run_journal)
+    time.sleep(0.6)
+    run_journal.close()
+
+    assert all(rsc.monitor_state == rscpkg.TaskState.CANCELLED for rsc in rscs)
+    assert not rscs[0].errors
+    assert journal.load_journal(str(tmp_path / "run.jsonl"))["late"]["state"] == "CANCELLED"
+
+def test_pending_cancels_dont_hold_exit():
+    code = ("from tests.test_cloudenrollment import CancelRSC\n"
+            "from rscbulkenrollment import cloudenrollment\n"
+            "cloudenrollment.cancel_rscs([CancelRSC('slow', delay=30)], deadline=0.2)\n")
+    start = time.monotonic()
+    subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, timeout=20)
+    assert time.monotonic() - start < 10
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_cancel_sent_once():
+    with RedfishSimulator(2, bind_duration=60) as simulator:
+        rscs = simulator.rscs()
+        for rsc in rscs:
+            rsc.login()
+            rsc.enroll_to_cloud(check_enrolled=False)
+        simulator.sessions.clear()
+        requests_before = simulator.requests
+        pending = cloudenrollment.cancel_rscs(rscs)
+        assert pending == rscs
+        assert simulator.requests == requests_before + 2
+        assert all(dev.bind_started is not None for dev in simulator.devices)
+
+        simulator.error_rate = 1.0
+        requests_before = simulator.requests
+        assert cloudenrollment.cancel_rscs(rscs) == rscs
+        assert simulator.requests == requests_before + 2
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+@pytest.mark.parametrize("select_query,select_requests", [
+    ("honor", 4), ("ignore", 4), ("reject", 1), (None, 0)])
+def test_lean_manager_reads(select_query, select_requests):
+    with RedfishSimulator(1, select_query=select_query) as simulator:
+        rsc = simulator.rscs()[0]
+        rsc.check_service_root()
+        rsc.login()
+        for _ in range(4):
+            assert rsc.is_enrolled_to_cloud() is False
+        assert simulator.select_requests == select_requests
+        assert rsc.uuid == simulator.devices[0].uuid
+        assert rsc.firmware_version == "1.2.3"
+        rsc.logout()
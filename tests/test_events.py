@@ -0,0 +1,44 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import json
+import sys
+
+import pytest
+from rscbulkenrollment import rsc_bulk_enroll
+from rscbulkenrollment.events import EVENTS
+from rscbulkenrollment.rsc import rsc as rscpkg
+from tests.simulator import RedfishSimulator
+
+def test_events_written_to_file(tmp_path):
+    filename = str(tmp_path / "events.ndjson")
+    rsc = rscpkg.RSC("192.168.0.1", "", "")
+    with EVENTS.output(filename):
+        rsc.monitor_state = rscpkg.TaskState.IN_PROGRESS
+        rsc.monitor_state = rscpkg.TaskState.IN_PROGRESS
+        rsc.add_error("timeout")
+    rsc.monitor_state = rscpkg.TaskState.SUCCESS
+
+    lines = [json.loads(line) for line in open(filename, encoding='utf-8')]
+    assert [(line["event"], line["address"]) for line in lines] == [
+        ("state", "192.168.0.1"), ("error", "192.168.0.1")]
+    assert lines[0]["state"] == "IN_PROGRESS"
+    assert lines[1]["error"] == "timeout"
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_events_streamed_to_stdout(monkeypatch, capsys):
+    with RedfishSimulator(1, password_change_required=True) as simulator:
+        device = simulator.devices[0]
+        monkeypatch.setattr(sys, "argv", [
+            "rsc_bulk_enroll", "-i", f"{simulator.address},{device.password},{device.new_password}",
+            "--ntp", "ntp.org", "--events", "-"])
+        rsc_bulk_enroll.main()
+
+    captured = capsys.readouterr()
+    events = [json.loads(line) for line in captured.out.splitlines()]
+    assert [event["event"] for event in events] == [
+        "logged_in", "password_changed", "logged_in", "settings_applied",
+        "bind_started", "state", "state"]
+    assert events[4]["user_code"] == device.user_code
+    assert [event["state"] for event in events[5:]] == ["IN_PROGRESS", "SUCCESS"]
+    assert "Final state is:" in captured.err
@@ -102,3 +102,28 @@ def test_duplicates_not_added(get_rscs):
         f"{rsc.address},{rsc.old_password}" for rsc in rscs])
     assert len(result) == 2
 
+
+def test_import_skips_duplicates(caplog):
+    rscs = importer.get_rscs_from_csv(StringIO(
+        "10.0.0.1,pass1\n10.0.0.2,pass2,new2\n10.0.0.1,pass1\n10.0.0.1,other\n"))
+
+    assert [(rsc.address, rsc.old_password) for rsc in rscs] == \
+        [("10.0.0.1", "pass1"), ("10.0.0.2", "pass2"), ("10.0.0.1", "other")]
+    assert rscs[1].new_password == "new2"
+    assert "line 3" in caplog.text
+
+def test_find_credential(tmp_path):
+    creds_file = tmp_path / "creds.csv"
+    creds_file.write_text("192.168.0.0/16,pass16\n*,default,newdefault\n192.168.240.0/24,pass24,new24\n")
+    credentials = importer.import_credentials(str(creds_file))
+
+    assert importer.find_credential("192.168.240.5", credentials).current_password == "pass24"
+    assert importer.find_credential("192.168.1.5", credentials).current_password == "pass16"
+    assert importer.find_credential("10.0.0.1", credentials).new_password == "newdefault"
+    assert importer.find_credential("10.0.0.1", credentials[:1]) is None
+
+def test_import_pool_size():
+    rscs = importer.import_rscs(rsc_list=["10.0.0.1,pass1", "10.0.0.2,pass2"], pool_size=5)
+    assert [rsc.pool_size for rsc in rscs] == [5, 5]
+    assert rscs[0].session.get_adapter("https://10.0.0.1")._pool_maxsize == 5
+    rscs[0].close()
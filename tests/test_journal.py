@@ -0,0 +1,47 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+from rscbulkenrollment import journal
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+def test_resume_from_journal(tmp_path):
+    filename = str(tmp_path / "run.jsonl")
+    enrolled = rscpkg.RSC("192.168.0.1", "old", "new")
+    running = rscpkg.RSC("192.168.0.2", "old", "new")
+    failed = rscpkg.RSC("192.168.0.3", "old", "new")
+
+    run_journal = journal.Journal(filename)
+    running.bind_monitor = "/redfish/v1/TaskService/TaskMonitors/1"
+    running.user_code = "ABCD"
+    running.monitor_state = rscpkg.TaskState.IN_PROGRESS
+    running.current_password = "new"
+    enrolled.monitor_state = rscpkg.TaskState.IN_PROGRESS
+    for rsc in (enrolled, running, failed):
+        run_journal.record(rsc, "enroll")
+    enrolled.monitor_state = rscpkg.TaskState.SUCCESS
+    run_journal.record(enrolled, "monitor")
+    run_journal.close()
+    with open(filename, 'a', encoding='utf-8') as journal_file:
+        journal_file.write('{"address": "192.168')
+
+    rscs = [rscpkg.RSC(rsc.address, "old", "new") for rsc in (enrolled, running, failed)]
+    to_monitor = journal.resume_rscs(rscs, journal.load_journal(filename))
+
+    assert to_monitor == [rscs[1]]
+    assert rscs[0].monitor_state == rscpkg.TaskState.SUCCESS
+    assert rscs[1].bind_monitor == running.bind_monitor
+    assert rscs[1].user_code == "ABCD"
+    assert rscs[1].current_password == "new"
+    assert rscs[2].monitor_state == rscpkg.TaskState.UNKNOWN
+    assert rscs[2].current_password == "old"
+
+def test_load_missing_journal(tmp_path):
+    assert journal.load_journal(str(tmp_path / "missing.jsonl")) == {}
+
+def test_record_after_close_dropped(tmp_path, caplog):
+    filename = str(tmp_path / "run.jsonl")
+    run_journal = journal.Journal(filename)
+    run_journal.close()
+    run_journal.record(rscpkg.RSC("192.168.0.1", "old", "new"), "enroll")
+    assert "is closed" in caplog.text
+    assert journal.load_journal(filename) == {}
@@ -0,0 +1,45 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pytest
+from rscbulkenrollment import metrics
+
+def test_histogram():
+    hist = metrics.Histogram()
+    for seconds in (0.001, 0.02, 0.02, 400):
+        hist.observe(seconds)
+
+    summary = hist.to_dict()
+    assert summary["count"] == 4
+    assert summary["max"] == 400
+    assert summary["buckets"]["0.005"] == 1
+    assert summary["buckets"]["0.025"] == 3
+    assert summary["buckets"]["300"] == 3
+    assert summary["buckets"]["+Inf"] == 4
+
+def test_metrics_export(tmp_path):
+    collected = metrics.Metrics()
+    collected.observe_request("login", 0.2)
+    collected.observe_request("get enrollment status", 0.1, "HTTP 503")
+    collected.count_retry("get enrollment status")
+    with pytest.raises(ValueError):
+        with collected.phase("192.168.0.1", "enroll"):
+            raise ValueError()
+
+    summary = collected.summary()
+    assert summary["requests"]["login"]["count"] == 1
+    assert summary["errors"] == [{"operation": "get enrollment status", "error": "HTTP 503",
+                                  "count": 1}]
+    assert summary["retries"] == {"get enrollment status": 1}
+    assert list(summary["devices"]["192.168.0.1"]) == ["enroll"]
+
+    prometheus = collected.to_prometheus()
+    assert 'rsc_request_duration_seconds_count{operation="login"} 1' in prometheus
+    assert ('rsc_request_errors_total{operation="get enrollment status",error="HTTP 503"} 1'
+            in prometheus)
+    assert 'rsc_phase_duration_seconds_bucket{phase="enroll",le="+Inf"} 1' in prometheus
+
+    collected.write_json(str(tmp_path / "metrics.json"))
+    assert json.loads((tmp_path / "metrics.json").read_text())["retries"] == summary["retries"]
@@ -0,0 +1,36 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pytest
+from rscbulkenrollment import password
+from rscbulkenrollment.rsc import rsc as rscpkg
+from tests.simulator import RedfishSimulator
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_rotate_passwords(tmp_path):
+    with RedfishSimulator(5) as simulator:
+        rscs = simulator.rscs()
+        no_new_password = rscpkg.RSC(simulator.address, simulator.devices[4].password, "")
+        rscs[4] = no_new_password
+
+        assert password.validate_rsc_passwords(rscs, workers=3)
+        outcomes = password.change_rsc_passwords(rscs, workers=3)
+        for rsc in rscs:
+            rsc.close()
+
+    assert [outcome.verified for outcome in outcomes] == [True] * 4 + [False]
+    assert outcomes[4].error == no_new_password.errors[0]
+    assert [dev.password for dev in simulator.devices[:4]] == \
+        [dev.new_password for dev in simulator.devices[:4]]
+    # validation login and read, change, logout, verification login and logout
+    assert simulator.requests == 4 * 6 + 3
+    assert not simulator.sessions
+
+    filename = tmp_path / "passwords.jsonl"
+    password.write_password_outcomes(str(filename), outcomes)
+    lines = [json.loads(line) for line in filename.read_text().splitlines()]
+    assert lines[0] == {"address": simulator.address, "changed": True, "verified": True,
+                        "error": ""}
+    assert "Password" not in filename.read_text()
@@ -0,0 +1,42 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+from rscbulkenrollment import preflight
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+class PreflightRSC(rscpkg.RSC):
+    def __init__(self, address, reachable):
+        super().__init__(address, "", "")
+        self.reachable = reachable
+
+    def check_service_root(self, timeout=rscpkg.DEFAULT_TIMEOUT):
+        if not self.reachable:
+            raise rscpkg.RSCException(f"Failed to connect to RSC {self.address}")
+
+def test_unreachable_rscs_marked(capsys):
+    rscs = [PreflightRSC("up1", True), PreflightRSC("down", False), PreflightRSC("up2", True)]
+
+    reachable = preflight.check_rscs_reachable(rscs, timeout=1)
+    preflight.print_unreachable(rscs)
+
+    assert reachable == [rscs[0], rscs[2]]
+    assert rscs[1].monitor_state == rscpkg.TaskState.UNREACHABLE
+    assert rscs[0].monitor_state == rscpkg.TaskState.UNKNOWN
+    output = capsys.readouterr().out
+    assert "2 of 3 RSCs reachable" in output
+    assert "Failed to connect to RSC down" in output
+
+def test_dead_host_fails_fast():
+    rsc = rscpkg.RSC("127.0.0.1:9", "", "")
+    assert preflight.check_rscs_reachable([rsc], timeout=1) == []
+    assert rsc.monitor_state == rscpkg.TaskState.UNREACHABLE
+    rsc.close()
+
+def test_invalid_address_unreachable():
+    bad = rscpkg.RSC("10.0.0.1 ", "", "")
+    dead = rscpkg.RSC("127.0.0.1:9", "", "")
+    assert preflight.check_rscs_reachable([bad, dead], timeout=1) == []
+    assert bad.monitor_state == rscpkg.TaskState.UNREACHABLE
+    assert "check service root" in bad.errors[0]
+    for rsc in (bad, dead):
+        rsc.close()
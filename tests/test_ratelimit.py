@@ -0,0 +1,50 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+from rscbulkenrollment import ratelimit
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+def test_token_bucket(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock.monotonic)
+    bucket = ratelimit.TokenBucket(rate=2, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+    clock.now += 1.0
+    assert bucket.reserve() == 0.5
+
+def test_rate_limiter(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(ratelimit.time, "sleep", clock.sleep)
+    limiter = ratelimit.RateLimiter()
+    assert limiter.acquire("192.168.0.1", "login") == 0
+
+    limiter.configure(subnet_rate=1, operation_rates={"enroll to cloud": 1})
+    assert limiter.acquire("192.168.0.1", "login") == 0
+    assert limiter.acquire("192.168.0.2:443", "login") == 1.0
+    assert limiter.acquire("192.168.1.1", "login") == 0
+    assert limiter.acquire("rsc-8DD123FFF", "login") == 0
+    assert limiter.acquire("192.168.2.1", "enroll to cloud") == 0
+    assert limiter.acquire("192.168.3.1", "enroll to cloud") == 1.0
+    assert clock.slept == [1.0, 1.0]
+
+def test_get_subnet():
+    assert ratelimit.get_subnet("192.168.0.77", 24) == "192.168.0.0/24"
+    assert ratelimit.get_subnet("10.1.2.3:8443", 16) == "10.1.0.0/16"
+    assert ratelimit.get_subnet("[fe80::1]:443", 24) == "fe80::/64"
+    assert ratelimit.get_subnet("fe80::1", 24) == "fe80::/64"
+    assert ratelimit.get_subnet("rsc-8DD123FFF", 24) is None
@@ -0,0 +1,207 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import pytest
+import requests
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+def test_get_message_from_body():
+    body = {"error": {"@Message.ExtendedInfo": [{
+        "Message": "Password does not meet requirements",
+        "Oem": {"HP": {"ErrorDetails": "too short"}}}]}}
+    assert rscpkg.get_message_from_body(body) == \
+        "Password does not meet requirements\nDetails: 'too short'"
+
+    assert rscpkg.get_message_from_body({"error": {
+        "@Message.ExtendedInfo": [{"Message": "Unauthorized"}]}}) == "Unauthorized"
+    assert rscpkg.get_message_from_body({"Id": "1"}) is None
+    assert rscpkg.get_message_from_body(None) is None
+    assert rscpkg.get_message_from_body([]) is None
+
+def test_get_task_state():
+    assert rscpkg.get_task_state(202) == rscpkg.TaskState.IN_PROGRESS
+    assert rscpkg.get_task_state(200) == rscpkg.TaskState.SUCCESS
+    assert rscpkg.get_task_state(201) == rscpkg.TaskState.SUCCESS
+    assert rscpkg.get_task_state(400) == rscpkg.TaskState.ERROR
+
+def test_get_proxy_ntp_settings():
+    assert rscpkg.get_proxy_ntp_settings("", "") == {}
+    assert rscpkg.get_proxy_ntp_settings("http://proxy:8080", "") == {
+        "Proxy": {"Enabled": True, "ProxyServerURI": "http://proxy:8080"}}
+    assert rscpkg.get_proxy_ntp_settings("", "ntp.org") == {
+        "NTP": {"NTPServers": ["ntp.org"], "ProtocolEnabled": True}}
+
+def test_parse_retry_after():
+    assert rscpkg.parse_retry_after("5") == 5.0
+    assert rscpkg.parse_retry_after(" 120 ") == 120.0
+    assert rscpkg.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert rscpkg.parse_retry_after("soon") is None
+    assert rscpkg.parse_retry_after("") is None
+    assert rscpkg.parse_retry_after(None) is None
+
+def make_response(status_code, body=b"{}", headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    return response
+
+def test_session_reused_and_renewed(monkeypatch):
+    rsc = rscpkg.RSC("192.168.0.10", "password", "")
+    logins = []
+    sent = []
+
+    def send(request, timeout, **_):
+        if request.url.endswith("/Sessions"):
+            logins.append(request.url)
+            return make_response(201, b'{"Id": "%d"}' % len(logins),
+                                 {rscpkg.TOKEN_HEADER_NAME: f"token{len(logins)}"})
+        sent.append(request.headers[rscpkg.TOKEN_HEADER_NAME])
+        if len(sent) == 1:
+            return make_response(401)
+        return make_response(200, b'{"PasswordChangeRequired": false}')
+
+    monkeypatch.setattr(rsc.session, "send", send)
+
+    rsc.login()
+    rsc.login()
+    assert len(logins) == 1
+
+    assert rsc.check_needs_change_password() is False
+    assert len(logins) == 2
+    assert sent == ["token1", "token2"]
+
+def test_rsc_connection_created_on_demand():
+    rsc = rscpkg.RSC("192.168.0.10", "password", "new")
+    assert rsc.connection is None
+    assert rsc.session_id == ""
+    assert not hasattr(rsc, "__dict__")
+    with pytest.raises(AttributeError):
+        rsc.address = "192.168.0.11"
+
+    session = rsc.session
+    assert rsc.connection is not None
+    assert rsc.session is session
+
+    rsc.close()
+    assert rsc.connection is None
+
+def test_retry_transient_failures(monkeypatch):
+    monkeypatch.setattr(rscpkg, "get_retry_delay", lambda policy, attempt, response: 0)
+    rsc = rscpkg.RSC("192.168.0.10", "password", "")
+    rsc.session_id = "1"
+    answers = [requests.exceptions.ConnectionError("reset"), make_response(503),
+               make_response(200, b'{"PasswordChangeRequired": false}')]
+
+    def send(request, timeout, **_):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(rsc.session, "send", send)
+    assert rsc.check_needs_change_password() is False
+    assert rsc.retries == 2
+
+def test_no_retry_of_processed_changes(monkeypatch):
+    monkeypatch.setattr(rscpkg, "get_retry_delay", lambda policy, attempt, response: 0)
+    rsc = rscpkg.RSC("192.168.0.10", "password", "")
+    rsc.session_id = "1"
+    sent = []
+
+    def send(request, timeout, **_):
+        sent.append(request.method)
+        return make_response(502)
+
+    monkeypatch.setattr(rsc.session, "send", send)
+    with pytest.raises(rscpkg.RSCException):
+        rsc.enroll_to_cloud(check_enrolled=False)
+    assert sent == ["POST"]
+    assert rsc.retries == 0
+
+def test_is_retryable():
+    idempotent = rscpkg.RetryPolicy()
+    change = rscpkg.RetryPolicy(idempotent=False)
+    assert rscpkg.is_retryable(idempotent, response=make_response(504))
+    assert not rscpkg.is_retryable(idempotent, response=make_response(500))
+    assert rscpkg.is_retryable(change, response=make_response(503))
+    assert not rscpkg.is_retryable(change, response=make_response(504))
+    assert rscpkg.is_retryable(change, exception=requests.exceptions.ConnectTimeout())
+    assert not rscpkg.is_retryable(change, exception=requests.exceptions.ReadTimeout())
+    assert rscpkg.is_retryable(idempotent, exception=requests.exceptions.ReadTimeout())
+
+def test_get_retry_delay():
+    policy = rscpkg.RetryPolicy(base_delay=1, max_delay=4)
+    for attempt in range(1, 6):
+        assert 0 <= rscpkg.get_retry_delay(policy, attempt) <= min(2 ** (attempt - 1), 4)
+    assert rscpkg.get_retry_delay(policy, 1, make_response(503, headers={"Retry-After": "2"})) == 2
+    assert rscpkg.get_retry_delay(policy, 1, make_response(503, headers={"Retry-After": "60"})) == 4
+
+def test_circuit_breaker(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rscpkg.time, "monotonic", lambda: now[0])
+    breaker = rscpkg.CircuitBreaker(threshold=2, cooldown=10)
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.record(False)
+    assert not breaker.allow()
+
+    now[0] += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.allow()
+
+def test_settings_applied():
+    desired = rscpkg.get_proxy_ntp_settings("http://proxy:8080", "ntp.org")
+    current = {"Proxy": {"Enabled": True, "ProxyServerURI": "http://proxy:8080"},
+               "NTP": {"NTPServers": ["ntp.org", ""], "ProtocolEnabled": True}, "SSH": {}}
+    assert rscpkg.settings_applied(current, desired)
+    current["NTP"]["NTPServers"] = ["other.org"]
+    assert not rscpkg.settings_applied(current, desired)
+    assert not rscpkg.settings_applied({}, desired)
+    assert rscpkg.settings_applied({}, {})
+
+def test_json_decoded_once(monkeypatch):
+    rsc = rscpkg.RSC("192.168.0.10", "password", "")
+    rsc.session_id = "1"
+    bodies = [{"PasswordChangeRequired": True},
+              {"error": {"@Message.ExtendedInfo": [{"Message": "Bad request"}]}}]
+    loads = []
+    monkeypatch.setattr(rscpkg.json, "loads",
+                        lambda content: loads.append(content) or bodies[len(loads) - 1])
+    responses = [make_response(200, b"..."), make_response(400, b"...")]
+    monkeypatch.setattr(rsc.session, "send", lambda request, timeout, **_: responses.pop(0))
+
+    assert rsc.check_needs_change_password() is True
+    assert len(loads) == 1
+    with pytest.raises(rscpkg.RSCException, match="Bad request"):
+        rsc.check_needs_change_password()
+    assert len(loads) == 2
+
+def test_rsc_exception_status_code():
+    rsc = rscpkg.RSC("192.168.0.10", "password", "")
+    with pytest.raises(rscpkg.RSCException) as exp:
+        rsc.raise_rsc_error(make_response(501), "RSC '%s' failed: %s")
+    assert exp.value.status_code == 501
+    assert rscpkg.RSCException("error").status_code is None
+
+def test_select_falls_back_to_full_read(monkeypatch):
+    rsc = rscpkg.RSC("192.168.0.10", "password", "")
+    rsc.session_id = "1"
+    rsc.select_supported = True
+    urls = []
+
+    def send(request, timeout, **_):
+        urls.append(request.url)
+        if "$select" in request.url:
+            return make_response(400)
+        return make_response(200, b'{"UUID": "u", "Oem": {"HP": {'
+                             b'"HPRemoteSystemManagerBindingStatus": {"BindingStatus": "Enrolled"}}}}')
+
+    monkeypatch.setattr(rsc.session, "send", send)
+    assert rsc.is_enrolled_to_cloud() is True
+    assert rsc.is_enrolled_to_cloud() is True
+    assert len(urls) == 3
+    assert "$select" in urls[0] and "$select" not in urls[1] + urls[2]
+    assert rsc.select_supported is False
@@ -0,0 +1,111 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+from zeroconf import ServiceStateChange
+from rscbulkenrollment.discovery import rsc_finder
+
+ADDRESSES = {
+    "rsc-1._rsc._tcp.local.": ["192.168.0.1"],
+    "rsc-2._rsc._tcp.local.": ["192.168.0.2"],
+    "rsc-1-again._rsc._tcp.local.": ["192.168.0.1"],
+    "no-ipv4._rsc._tcp.local.": [],
+}
+
+class FakeServiceInfo:
+    '''Resolves the services in ADDRESSES after a short delay'''
+    requests = []
+
+    def __init__(self, service_type, name):
+        self.service_type = service_type
+        self.name = name
+        self.server = name.split(".")[0] + ".local."
+
+    async def async_request(self, zeroconf, timeout):
+        FakeServiceInfo.requests.append(self.name)
+        await asyncio.sleep(0.05)
+        return self.name in ADDRESSES
+
+    def parsed_addresses(self, version):
+        return ADDRESSES[self.name]
+
+class FakeZeroconf:
+    '''Stands for AsyncZeroconf'''
+    zeroconf = None
+
+    async def async_close(self):
+        pass
+
+class FakeServiceBrowser:
+    '''Announces 'names' to the handlers, each after its delay'''
+    names = []
+
+    def __init__(self, zeroconf, service_types, handlers):
+        self.handlers = [asyncio.get_running_loop().call_later(
+            delay, handlers[0], zeroconf, service_types[0], name, ServiceStateChange.Added)
+            for delay, name in self.names]
+
+    async def async_cancel(self):
+        for handle in self.handlers:
+            handle.cancel()
+
+def announce(browser, name, state_change=ServiceStateChange.Added):
+    browser.on_service_state_change(None, rsc_finder.SERVICE_TYPE, name, state_change)
+
+def test_browser_deduplicates(monkeypatch):
+    monkeypatch.setattr(rsc_finder, "AsyncServiceInfo", FakeServiceInfo)
+    FakeServiceInfo.requests = []
+    found = []
+
+    async def browse():
+        browser = rsc_finder.RSCBrowser(None, found.append)
+        assert not browser.is_quiet(0)
+        for name in ["rsc-1._rsc._tcp.local.", "rsc-1._rsc._tcp.local.",
+                     "rsc-2._rsc._tcp.local.", "rsc-1-again._rsc._tcp.local.",
+                     "no-ipv4._rsc._tcp.local.", "unknown._rsc._tcp.local."]:
+            announce(browser, name)
+        announce(browser, "removed._rsc._tcp.local.", ServiceStateChange.Removed)
+        assert not browser.is_quiet(0)
+        await asyncio.gather(*list(browser.tasks))
+        assert browser.is_quiet(0)
+        assert not browser.is_quiet(60)
+        return browser
+
+    browser = asyncio.run(browse())
+    assert len(FakeServiceInfo.requests) == 5
+    assert "removed._rsc._tcp.local." not in browser.names
+    assert sorted(browser.rscs) == ["192.168.0.1", "192.168.0.2"]
+    assert [rsc.address for rsc in found] == ["192.168.0.1", "192.168.0.2"]
+
+def discover(monkeypatch, names, max_time, quiet_time):
+    '''Runs discover_rscs_async with fake zeroconf, returning the RSCs and time spent'''
+    monkeypatch.setattr(rsc_finder, "AsyncServiceInfo", FakeServiceInfo)
+    monkeypatch.setattr(rsc_finder, "AsyncZeroconf", FakeZeroconf)
+    monkeypatch.setattr(rsc_finder, "AsyncServiceBrowser", FakeServiceBrowser)
+    monkeypatch.setattr(FakeServiceBrowser, "names", names)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        rscs = await rsc_finder.discover_rscs_async(max_time, quiet_time)
+        return rscs, loop.time() - start
+
+    return asyncio.run(run())
+
+def test_discovery_ends_when_quiet(monkeypatch):
+    rscs, elapsed = discover(monkeypatch, [(0.5, "rsc-1._rsc._tcp.local."),
+                                           (0.6, "rsc-2._rsc._tcp.local.")],
+                             max_time=10, quiet_time=0.3)
+    assert sorted(rsc.address for rsc in rscs) == ["192.168.0.1", "192.168.0.2"]
+    assert 0.9 <= elapsed < 2
+
+def test_discovery_waits_for_first_answer(monkeypatch):
+    rscs, elapsed = discover(monkeypatch, [], max_time=1, quiet_time=0.1)
+    assert not rscs
+    assert elapsed >= 1
+
+    rscs, elapsed = discover(monkeypatch, [(0.8, "rsc-1._rsc._tcp.local.")],
+                             max_time=10, quiet_time=0.1)
+    assert [rsc.address for rsc in rscs] == ["192.168.0.1"]
+    assert 0.8 <= elapsed < 2
@@ -0,0 +1,56 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import subprocess
+import sys
+import threading
+import time
+
+from rscbulkenrollment import sessions
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+class LogoutRSC(rscpkg.RSC):
+    def __init__(self, address, error=None, hang=None):
+        super().__init__(address, "", "")
+        self.connection = rscpkg.Connection()
+        self.error = error
+        self.hang = hang
+        self.closed_with = None
+
+    def close(self, timeout=rscpkg.DEFAULT_TIMEOUT):
+        self.closed_with = timeout
+        if self.hang:
+            self.hang.wait()
+        if self.error:
+            raise rscpkg.RSCException(self.error)
+
+def test_session_manager_closes_all():
+    hang = threading.Event()
+    closed = LogoutRSC("ok")
+    failed = LogoutRSC("failed", error="connection refused")
+    stuck = LogoutRSC("stuck", hang=hang)
+    never_contacted = rscpkg.RSC("idle", "", "")
+
+    start = time.monotonic()
+    try:
+        with sessions.SessionManager([closed, failed, stuck, never_contacted],
+                                     timeout=1, deadline=0.2) as manager:
+            pass
+        assert time.monotonic() - start < 1
+    finally:
+        hang.set()
+
+    assert closed.closed_with == 1
+    assert set(manager.failed) == {"failed", "stuck"}
+    assert manager.failed["failed"] == "connection refused"
+
+def test_stuck_logouts_dont_hold_exit():
+    code = ("import threading\n"
+            "from tests.test_sessions import LogoutRSC\n"
+            "from rscbulkenrollment import sessions\n"
+            "manager = sessions.SessionManager([LogoutRSC('stuck', hang=threading.Event())],"
+            " deadline=0.2)\n"
+            "assert set(manager.close_all()) == {'stuck'}\n")
+    start = time.monotonic()
+    subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, timeout=20)
+    assert time.monotonic() - start < 10
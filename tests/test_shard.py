@@ -0,0 +1,47 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import pytest
+from rscbulkenrollment import shard
+from rscbulkenrollment.rsc import rsc as rscpkg
+
+def test_parse_shard():
+    assert shard.parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "2", "a/4", "1/0"):
+        with pytest.raises(ValueError):
+            shard.parse_shard(value)
+
+def test_select_shard():
+    rscs = [rscpkg.RSC(f"10.0.{subnet}.{host}", "", "")
+            for subnet in range(8) for host in range(1, 9)]
+    shards = [shard.select_shard(rscs, (index, 3)) for index in (1, 2, 3)]
+    assert sorted(sum(shards, []), key=rscs.index) == rscs
+    assert all(shards)
+
+    by_subnet = [shard.select_shard(rscs, (index, 3), "subnet") for index in (1, 2, 3)]
+    assert sum(len(part) for part in by_subnet) == len(rscs)
+    for part in by_subnet:
+        subnets = {rsc.address.rsplit(".", 1)[0] for rsc in part}
+        assert len(part) == 8 * len(subnets)
+
+def test_merge_results(tmp_path):
+    enrolled = rscpkg.RSC("192.168.0.1", "secret", "")
+    enrolled.monitor_state = rscpkg.TaskState.SUCCESS
+    enrolled.retries = 2
+    failed = rscpkg.RSC("192.168.0.2", "secret", "")
+    failed.monitor_state = rscpkg.TaskState.ERROR
+    failed.errors.append("Failed login")
+    retried = rscpkg.RSC("192.168.0.2", "secret", "")
+    retried.monitor_state = rscpkg.TaskState.ALREADY_ENROLLED
+
+    shard.write_results(str(tmp_path / "1.jsonl"), [enrolled, failed])
+    shard.write_results(str(tmp_path / "2.jsonl"), [retried])
+    assert "secret" not in (tmp_path / "1.jsonl").read_text()
+    with open(tmp_path / "2.jsonl", 'a', encoding='utf-8') as results_file:
+        results_file.write('{"address": "192.168.0.3", "state": "BOGUS"}\n')
+
+    rscs = shard.load_results([str(tmp_path / "1.jsonl"), str(tmp_path / "2.jsonl")])
+    assert [rsc.address for rsc in rscs] == ["192.168.0.1", "192.168.0.2"]
+    assert rscs[0].monitor_state == rscpkg.TaskState.SUCCESS
+    assert rscs[0].retries == 2
+    assert rscs[1].monitor_state == rscpkg.TaskState.ALREADY_ENROLLED
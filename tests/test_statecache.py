@@ -0,0 +1,77 @@
+# Copyright 2024 HP Development Company, L.P.
+# SPDX-License-Identifier: MIT
+
+import pytest
+from rscbulkenrollment import statecache
+from rscbulkenrollment.rsc import rsc as rscpkg
+from tests.simulator import RedfishSimulator
+
+def same_rscs(rscs, service_uuid="service-1"):
+    '''New RSC objects for the addresses of 'rscs', as read from a new run'''
+    copies = [rscpkg.RSC(rsc.address, "old", "new") for rsc in rscs]
+    for rsc in copies:
+        rsc.service_uuid = service_uuid
+    return copies
+
+def test_skip_recently_enrolled(tmp_path, monkeypatch):
+    filename = str(tmp_path / "state.json")
+    enrolled = rscpkg.RSC("192.168.0.1", "old", "new")
+    enrolled.monitor_state = rscpkg.TaskState.SUCCESS
+    enrolled.uuid = "uuid-1"
+    enrolled.service_uuid = "service-1"
+    failed = rscpkg.RSC("192.168.0.2", "old", "new")
+    failed.monitor_state = rscpkg.TaskState.ERROR
+
+    cache = statecache.StateCache(filename)
+    cache.update([enrolled, failed], None, "ntp.org")
+    cache.save()
+
+    rscs = same_rscs([enrolled, failed])
+    cache = statecache.StateCache(filename, ttl=60)
+    assert cache.apply(rscs, None, "ntp.org") == [rscs[0]]
+    assert rscs[0].monitor_state == rscpkg.TaskState.ALREADY_ENROLLED
+    assert rscs[0].uuid == "uuid-1"
+    assert rscs[1].monitor_state == rscpkg.TaskState.UNKNOWN
+
+    other_rscs = same_rscs([enrolled, failed])
+    assert cache.apply(other_rscs, None, "other.org") == []
+    assert cache.apply(other_rscs, None, None) == [other_rscs[0]]
+
+    assert cache.apply(same_rscs([enrolled], "service-2"), None, "ntp.org") == []
+    assert cache.apply(same_rscs([enrolled], ""), None, "ntp.org") == []
+
+    now = statecache.time.time()
+    monkeypatch.setattr(statecache.time, "time", lambda: now + 61)
+    assert cache.apply(same_rscs([enrolled]), None, "ntp.org") == []
+
+def test_invalid_cache(tmp_path):
+    filename = tmp_path / "state.json"
+    assert statecache.load_cache(str(filename)) == {}
+    filename.write_text("[1, 2")
+    assert statecache.load_cache(str(filename)) == {}
+    filename.write_text('{"192.168.0.1": 1, "192.168.0.2": {"checked_at": 1}}')
+    assert statecache.load_cache(str(filename)) == {"192.168.0.2": {"checked_at": 1}}
+
+@pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+def test_replaced_rsc_checked_again(tmp_path):
+    with RedfishSimulator(1) as simulator:
+        enrolled = simulator.rscs()[0]
+        statecache.read_service_uuids([enrolled])
+        assert enrolled.service_uuid == simulator.service_uuid
+        enrolled.monitor_state = rscpkg.TaskState.SUCCESS
+        cache = statecache.StateCache(str(tmp_path / "state.json"))
+        cache.update([enrolled], None, None)
+
+        rscs = simulator.rscs() + [rscpkg.RSC("127.0.0.1:1", "old", "new")]
+        statecache.read_service_uuids(rscs, timeout=1)
+        assert rscs[1].service_uuid == ""
+        assert cache.apply(rscs, None, None) == [rscs[0]]
+
+        simulator.service_uuid = "replaced"
+        replaced = simulator.rscs()
+        statecache.read_service_uuids(replaced)
+        assert cache.apply(replaced, None, None) == []
+        assert replaced[0].monitor_state == rscpkg.TaskState.UNKNOWN
+        requests = simulator.requests
+        statecache.read_service_uuids(replaced)
+        assert simulator.requests == requests